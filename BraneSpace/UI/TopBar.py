@@ -74,6 +74,16 @@ class TopBar(pygame.sprite.Sprite):
                 width=self.cellBorder,
                 border_radius = self.cellRadius)
         
+        # debug info
+        self.debugPos = self.fpsPos + self.fpsCell.get_width() + 4
+        self.debugCell = pygame.Surface((int(12*view.serif_font_px_size*0.5),
+                                       self.cellHeight), flags=SRCALPHA)
+        pygame.draw.rect(
+                surface=self.debugCell, color=(30, 30, 60, 255),
+                rect=self.debugCell.get_rect(),
+                width=self.cellBorder,
+                border_radius = self.cellRadius)
+        
         # Resources gathered (Score)
         self.scoreCell = pygame.Surface((int(8*view.serif_font_px_size*0.5),
                                        self.cellHeight), flags=SRCALPHA)
@@ -109,6 +119,17 @@ class TopBar(pygame.sprite.Sprite):
         temp.blit(text, (4, int((self.cellHeight-imgH)*0.5)))
         view.displaysurface.blit(temp, (self.fpsPos, 4))
         
+        # show brane upscale filter in debug mode
+        if(view.debug and self.player and self.player.parentBrane):
+            text = view.serif_font.render(
+                f"Brane: {self.player.parentBrane.scaleFilter}",
+                False, (200,200,200)
+                )
+            imgW, imgH = text.get_size()
+            temp = self.debugCell.copy()
+            temp.blit(text, (4, int((self.cellHeight-imgH)*0.5)))
+            view.displaysurface.blit(temp, (self.debugPos, 4))
+        
         # show score
         if(not self.player):
             score = 0
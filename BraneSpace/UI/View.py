@@ -10,7 +10,7 @@ import numpy as np
 import numpy.typing as npt
 import pygame
 import BraneSpace.core.GlobalRules as GlobalRules
-from BraneSpace.utils.Geometry import expandPeriodicImages
+from BraneSpace.utils.Geometry import expandPeriodicImages, shift_arr
 from BraneSpace.core.GlobalRules import HEIGHT, WIDTH
 from pygame.locals import *
 
@@ -19,6 +19,11 @@ SQRT2 = np.sqrt(2)
 
 
 class View():
+    # draw queue layers, flushed bottom to top
+    LAYER_BRANE = 0
+    LAYER_SPRITES = 1
+    LAYER_DEBUG = 2
+    
     def __init__(self):
         pygame.init()
 
@@ -45,6 +50,15 @@ class View():
         
         self.focus = None
         
+        # (surface, destination) records of this frame, one list per layer
+        self.drawQueue = [[] for l in range(self.LAYER_DEBUG+1)]
+        self.circleSurfs = {} # circle sprites by (color, radius, thickness)
+        
+        # results of the last cull(), looked up by entity
+        self.cullRows = {}
+        self.cullVis = np.zeros((0,1), dtype=bool)
+        self.cullPos = np.zeros((0,1,2))
+        
     def resize(self, w, h):
         # make changes from resizing avilable globaly even without importing View
         global HEIGHT
@@ -60,9 +74,11 @@ class View():
         """
         self.focus = f
         
-    def update(self, dt):
+    def update(self, dt, focusPos: npt = None):
         """
         Update position of this view to track its focus.
+        focusPos : where the focus is drawn, if not at its r,
+                   e.g. between simulation steps.
         """
         if(self.focus is None):
             # skip if no focus set
@@ -75,16 +91,18 @@ class View():
         screen_size = np.min(self.screen_box).astype(float)
         
         # where do we want to converge to? The focus.
+        if(focusPos is None):
+            focusPos = self.focus.r
         if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
             # if pbc, target the nearest periodic image
-            pos = expandPeriodicImages(self.focus.r,
+            pos = expandPeriodicImages(focusPos,
                                        GlobalRules.curUniverseSize)
             dif = np.abs(self.center - pos)
             dif_sq = np.einsum("ij,ij->i", dif,dif) # dot only in last axis
             nearest = np.argmin(dif_sq) # index of nearest image
             target = pos[nearest]
         else:
-            target = self.focus.r
+            target = focusPos
         
         
         # How far away is the focus for center now? Fraction of screen.
@@ -113,10 +131,50 @@ class View():
             self.center[self.center<0] += GlobalRules.curUniverseSize
         
         
+    def cull(self, ents: list, r: npt = None) -> (npt, npt):
+        """
+        Which periodic images of many entities are on screen, in one pass.
+        ents : entities to cull.
+        r : their positions in shape (n,2), gathered from ents if None.
+        Returns visibility in shape (n,k) and in-universe image coordinates
+        in shape (n,k,2), with k=9 images with PBC and 1 without.
+        Results are kept for isOnScreen() and periodicImagesOnScreen()
+        of these entities until the next cull.
+        """
+        n = len(ents)
+        if(r is None):
+            r = np.empty((n,2))
+            for k, e in enumerate(ents):
+                r[k] = e.r
+        size = np.fromiter((getattr(e, "size", 0.) for e in ents),
+                           dtype=float, count=n)
+        
+        # image shifts and screen half extents of this frame
+        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+            shifts = shift_arr*GlobalRules.curUniverseSize
+        else:
+            shifts = np.zeros((1,2))
+        halfScreen = 0.5*self.screen_box/self.zoom
+        
+        pos = r[:,np.newaxis,:] + shifts # (n,k,2)
+        reach = halfScreen + (size*SQRT2/self.zoom)[:,np.newaxis] # (n,2)
+        vis = np.all(np.abs(pos - self.center) < reach[:,np.newaxis,:],
+                     axis=-1)
+        
+        self.cullRows = dict(zip(ents, range(n)))
+        self.cullVis = vis
+        self.cullPos = pos
+        return(vis, pos)
+        
+        
     def isOnScreen(self, ent: "Entity") -> bool:
         """
         Check if entity is in screen area and should be drawn.
+        Uses the result of the last cull() if it included ent.
         """
+        row = self.cullRows.get(ent)
+        if(row is not None):
+            return(bool(np.any(self.cullVis[row])))
         
         if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
             # if pbc, check if nearest image of ent is on screen
@@ -134,31 +192,71 @@ class View():
     def periodicImagesOnScreen(self, ent: "Entity") -> (npt, npt):
         """
         Which periodic images are on screen?
-        Returns their visibility along with in-universe image coordinates.
+        Returns their visibility along with in-universe image coordinates,
+        for 9 images with PBC and just the entity without.
+        Uses the result of the last cull() if it included ent.
         """
-        pos = expandPeriodicImages(ent.r, GlobalRules.curUniverseSize)
+        row = self.cullRows.get(ent)
+        if(row is not None):
+            return(self.cullVis[row], self.cullPos[row])
+        
+        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+            pos = expandPeriodicImages(ent.r, GlobalRules.curUniverseSize)
+        else:
+            pos = ent.r[np.newaxis,:]
         dif = np.abs(self.center - pos)
         cond = dif < ((0.5*self.screen_box + ent.size*SQRT2)/self.zoom)[np.newaxis,:]
         return(np.all(cond, axis=-1), pos)
         
         
-    def drawSurfToView(self, surf: "pygame.Surface", r: npt):
+    def queueBlit(self, surf: "pygame.Surface", dest,
+                  layer: int = LAYER_SPRITES):
+        """
+        Queue a blit to screen coordinates dest for the next flush().
         """
-        Draw a single surface to screen at world coordinates r.
+        self.drawQueue[layer].append((surf, dest))
+        
+    def drawSurfToView(self, surf: "pygame.Surface", r: npt,
+                       layer: int = LAYER_SPRITES):
+        """
+        Draw a surface to screen at world coordinates r, either a single
+        position or one per row. Drawing is queued until flush().
         Will adjust position on screen accordeeing to view movement.
         """
         pos = self.transform(r)
-        rect = surf.get_rect(center=pos)
-        self.displaysurface.blit(surf, rect)
+        queue = self.drawQueue[layer]
+        if(pos.ndim == 1):
+            queue.append((surf, surf.get_rect(center=pos)))
+        else:
+            for p in pos:
+                queue.append((surf, surf.get_rect(center=p)))
         
     def drawCircleToView(self, color: tuple, r: npt, radius: float,
-                         thickness: float = 2):
+                         thickness: float = 2, layer: int = LAYER_DEBUG):
         """
         Draw a single circle to screen at world coordinates r.
+        Queued as a blit of a reused circle sprite until flush().
         Will adjust position on screen accordeeing to view movement.
         """
-        pygame.draw.circle(self.displaysurface, color, self.transform(r),
-                            radius, thickness)
+        key = (tuple(color), int(radius), int(thickness))
+        surf = self.circleSurfs.get(key)
+        if(surf is None):
+            size = 2*key[1] + 1
+            surf = pygame.Surface((size, size), flags=pygame.SRCALPHA)
+            pygame.draw.circle(surf, color, (key[1], key[1]),
+                               key[1], key[2])
+            self.circleSurfs[key] = surf
+        self.drawSurfToView(surf, r, layer)
+        
+    def flush(self):
+        """
+        Draw everything queued this frame with one Surface.blits call
+        per layer and empty the queues.
+        """
+        for queue in self.drawQueue:
+            if(queue):
+                self.displaysurface.blits(queue, doreturn=False)
+                queue.clear()
         
         
     def keepPlayerInView(self, player_r: npt):
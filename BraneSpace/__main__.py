@@ -26,12 +26,14 @@ from BraneSpace.entities.SimpleObjects import Ball
 from BraneSpace.entities.resources.Resources import DarkMatter
 from BraneSpace.entities.structures.Portal import Portal
 from BraneSpace.entities.hazards.Asteroid import Asteroid
+from BraneSpace.entities.hazards.Explosion import Explosion
 from BraneSpace.entities.Player import Player
 from BraneSpace.core.Universe import Universe
+from BraneSpace.core.PhysicsProcess import PhysicsProcess
+from BraneSpace.core.FixedTimestep import FixedTimestep
 from BraneSpace.UI.TopBar import TopBar
 from BraneSpace.utils.AssetFactory import assetFactory
-from BraneSpace.utils.Geometry import selfdot
-import time
+from BraneSpace.utils.Geometry import selfdot, interpolateStep
 
 
 def reset(_uni, _tb, _view):
@@ -117,7 +119,12 @@ view = View()
 view.debug = False
 
 # create a universe. It will in turn create a brane.
-universe = Universe(view, parallel=False, braneSurfScale=4.0)
+# Physics can run in its own process, if asked to with --parallel-physics.
+parallel = "--parallel-physics" in sys.argv[1:]
+if(parallel and not PhysicsProcess.supported()):
+    print("Parallel physics needs the fork start method, running it serially.")
+    parallel = False
+universe = Universe(view, parallel=parallel, braneSurfScale=4.0)
 
 # init UI
 tb = TopBar(view)
@@ -141,6 +148,8 @@ Make them collide and collect dropped resources.
 <WASD> or arrow keys to move
 <SPACE> for repulsor beam
 <SHIFT> + <SPACE> for tractor beam
+<F1> debug view, <F2> brane upscale filter
+<F3> render brane in background (1 frame behind)
 <ESC> to quit"""
 help_surf = multilineText2Surf(help_text, help_font,
                                color=(219,188,86), centered=True)
@@ -148,6 +157,8 @@ help_surf = multilineText2Surf(help_text, help_font,
 
 # load assets
 assetFactory.preloadAll()
+Explosion.loadFrames()
+DarkMatter.loadFrames()
 
 # init game state
 player = reset(universe, tb, view);
@@ -156,9 +167,10 @@ player = reset(universe, tb, view);
 # initial guess at frame time
 dt = 1000./FPS
 
-updatesPerFrame = 1     # start with 1
-maxUpdatesPerFrame = 1  # increase to this many if fast enough
-update_dt = dt/updatesPerFrame
+# simulate in fixed steps of the nominal frame time,
+# catching up on at most a few of them per frame
+scheduler = FixedTimestep(1000./FPS, maxSteps=4)
+update_dt = scheduler.dt
 
 # screen capture
 screen_cap = False
@@ -173,6 +185,7 @@ while True:
     # event processing
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
+            universe.shutdown()
             pygame.quit()
             sys.exit()
         
@@ -195,6 +208,14 @@ while True:
             elif event.key == pygame.K_SPACE:
                 player.wavegen = True
 
+            # debug overlay, brane upscale filter and background rendering
+            if event.key == pygame.K_F1:
+                view.debug = not view.debug
+            elif event.key == pygame.K_F2:
+                universe.brane.cycleScaleFilter()
+            elif event.key == pygame.K_F3:
+                universe.brane.setPipelined(universe.brane.pipeline is None)
+            
             # toggle screen capture
             if event.key == pygame.K_F12:
                 screen_cap = not screen_cap
@@ -229,6 +250,7 @@ while True:
                 # resets if Game Over
                 if(universe.game_over):
                     player = reset(universe, tb, view)
+                    scheduler.reset()
                     universe.paused = False
                 
                 
@@ -239,15 +261,12 @@ while True:
                 
             
     # run the force calculation, position updates, and collision detection
-    update_ms_left = min(dt, 1000./FPS)*0.8
-    update_ms = 1000
-    if(not universe.game_over and not universe.paused):
-        for u in range(updatesPerFrame):
-            startTime = time.time()
-            
+    # for every whole time step that elapsed
+    running = not universe.game_over and not universe.paused
+    if(running):
+        for u in range(scheduler.advance(dt)):
             # update objects
-            for entity in universe.updatables:
-                entity.update(update_dt)
+            universe.update(update_dt)
                 
             # collisions between collidables (including player)
             universe.collisionDetect(update_dt)
@@ -255,16 +274,15 @@ while True:
             # attepmpt picking up collectables
             player.attemptPickUp(universe.collectables, view, update_dt)
             
-            update_ms = (time.time()-startTime)*1000.
-            update_ms_left -= update_ms
-            # remainingUpdates = updatesPerFrame - 1 - u
-            if(update_ms_left < update_ms and u+1!=updatesPerFrame):
-                # not enough time for another update,
-                # and this is not the last scheduled one
-                break
+            # apply spawns and destruction requested during this step
+            universe.commit()
+    
+    # draw entities between the last two steps, by the time left over;
+    # a stopped game shows its last state
+    alpha = scheduler.alpha if running else 1.
     
     # update view after focus position has been updated
-    view.update(dt)
+    view.update(dt, interpolateStep(player.r, player.dr, alpha))
     
     # show bounding primitives if game over
     if(universe.game_over):
@@ -280,7 +298,7 @@ while True:
         
         # spawn more hazards if too few
         while desired_hazards>cur_hazards:
-            roid = Asteroid()
+            roid = Asteroid.pool.acquire()
             roid.grow = True
             roid.size = 0.
             roid.collisionRadius=0.
@@ -309,9 +327,18 @@ while True:
     # wipe screen 
     view.displaysurface.fill((0,0,0))
  
+    # find visible periodic images of all entities at once
+    store = universe.entities
+    view.cull(store.owners, store.interpolatedPositions(alpha))
+    
+    # in parallel mode, the next physics step runs while this frame is drawn
+    if(not universe.game_over and not universe.paused):
+        universe.startPhysicsStep(update_dt)
+    
     # draw everything
     for entity in universe.drawables:
         entity.draw(view)
+    view.flush()
         
         
     # draw the UI
@@ -352,9 +379,4 @@ while True:
     # wait for next frame
     dt = view.FramePerSec.tick(FPS)
     
-    # recalculate updatesPerFrame
-    updatesPerFrame = min(int(min(dt, 1000./FPS)*0.8/update_ms), maxUpdatesPerFrame)
-    updatesPerFrame = max(1, updatesPerFrame)
-    update_dt = dt/updatesPerFrame
-    
     
\ No newline at end of file
@@ -6,11 +6,17 @@ Created on Fri May 10 13:37:21 2024
 @author: zetadin
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import copy
 import numpy as np
 import numpy.typing as npt
 import pygame
 import BraneSpace.core.GlobalRules as GlobalRules
-from BraneSpace.utils.Geometry import expandPeriodicImages
+from BraneSpace.utils.Geometry import expandPeriodicImages, periodicAxisRanges
+from BraneSpace.core.Registry import Registry
+from BraneSpace.core.BranePipeline import BranePipeline
+from BraneSpace.utils.Colormaps import colormaps
+from BraneSpace.wavelets.TractorStore import TractorStore
 
 
 VV = 32/1000.
@@ -18,19 +24,38 @@ LL = 16
 
 
 class Brane(pygame.sprite.Sprite):
-    def __init__(self, surf_scale: float, view: "View"):
+    # filters for upscaling the brane layer to the screen, costliest first
+    scaleFilters = ("smooth", "nearest", "scale2x")
+    tilesPerWorker = 4 # row tiles per worker thread, to balance the load
+    
+    def __init__(self, surf_scale: float, view: "View", workers: int = 1):
         super().__init__()
         self.setView(view)
         
+        # threads evaluating row tiles of the grid.
+        # NumPy releases the GIL inside the field kernels.
+        self.executor = None # created on first use if workers > 1
+        self.setWorkers(workers)
+        
         self.surfScale = surf_scale
+        self.lut = colormaps["grey"] # intensity colors, (256,3) uint8
         self.calculateSimShape()
         
         self.I = None # intensity
-        self.surf = None # temporary
+        self.G = None # gradient of intensity, only if drawGradients
+        self.surf = None # screen sized, reused while its size holds
+        self.scale2xBufs = [] # intermediate doublings for scale2x
+        self.scaleFilter = "smooth"
         
-        self.elapsed = 0.
-        self.wavelets=[]
+        self.elapsed = 0. # simulated time, keys the cached fields
+        self.fieldsKey = None # what I and G were last computed for
+        self.wavelets = Registry()
+        self.tractors = TractorStore() # batched Tractor wavelets
         self.drawGradients = False
+        self.gradStride = 1 # grid points per gradient sample, each axis
+        self.gradSurf = None # gradient overlay, reused while its shape holds
+        self.gradScaled = None # overlay upscaled to the grid, if coarser
+        self.pipeline = None # BranePipeline rendering in the background, if any
         
         self.parentUniverse = None
         
@@ -50,36 +75,193 @@ class Brane(pygame.sprite.Sprite):
         screenShape = np.array(self.view.displaysurface.get_size())
         self.simShape = np.ceil(screenShape/self.surfScale).astype(int)
         
-        # also compute the coordinate grid in world coords
-        grid_x = np.arange(self.simShape[0])*self.surfScale
-        grid_y = np.arange(self.simShape[1])*self.surfScale
-               
-        self.base_coords = np.zeros((self.simShape[0], self.simShape[1], 2))
-        self.base_coords[:,:,0] = np.repeat(grid_x[:,np.newaxis],
-                                       self.simShape[0], axis=1)
-        self.base_coords[:,:,1] = np.repeat(grid_y[np.newaxis,:],
-                                       self.simShape[1], axis=0)
-        self.coords = self.base_coords
+        # also compute the coordinate grid in world coords.
+        # It is axis aligned, so x and y are kept as separate 1D axes.
+        self.base_xs = np.arange(self.simShape[0])*self.surfScale
+        self.base_ys = np.arange(self.simShape[1])*self.surfScale
+        self.xs = self.base_xs
+        self.ys = self.base_ys
+        self.gridOrigin = np.zeros(2) # world coords of grid point (0,0)
+        
+        # surfaces and buffers reused by every frame of this shape
+        shape = (self.simShape[0], self.simShape[1])
+        self.ampBuf = np.zeros(shape) # quantized intensity
+        self.ampSurf = pygame.Surface(shape, depth=8) # colormap indices
+        self.ampSurf.set_palette([tuple(c) for c in self.lut])
+        self.rgbSurf = pygame.Surface(shape, depth=32) # colorized
+        
+    def setWorkers(self, workers: int):
+        """
+        Set the number of threads that evaluate the fields on the grid.
+        """
+        if(workers < 1):
+            raise ValueError("Brane needs at least one worker.")
+        if(self.executor is not None and workers != self.workers):
+            self.shutdown()
+        self.workers = workers
+        
+    def shutdown(self):
+        """
+        Stop the worker threads. They are restarted if needed again.
+        """
+        if(self.pipeline is not None):
+            self.pipeline.shutdown() # its renders use the workers too
+        if(self.executor is not None):
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        
+    def fieldExecutor(self) -> ThreadPoolExecutor:
+        """
+        Pool of the worker threads, started on first use.
+        """
+        if(self.executor is None):
+            self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                               thread_name_prefix="brane")
+        return(self.executor)
+        
+    def setPipelined(self, enabled: bool, latency: int = 1):
+        """
+        Render the brane on a background thread, shown latency frames
+        after its state was taken. With latency 0 each frame still waits
+        for its own render. See BranePipeline.
+        """
+        if(self.pipeline is not None):
+            self.pipeline.shutdown()
+            self.pipeline = None
+        if(enabled):
+            self.pipeline = BranePipeline(self, latency)
+        
+    def loadState(self, brane: "Brane"):
+        """
+        Take over the wavelets, simulated time and display settings
+        of another brane, to render what it would.
+        Wavelets are copied, so the other brane can keep updating its own.
+        """
+        self.tractors.loadSnapshot(brane.tractors.snapshot())
+        self.wavelets.clear()
+        for wl in brane.wavelets:
+            self.wavelets.append(copy.copy(wl))
+        self.elapsed = brane.elapsed
+        if(self.lut is not brane.lut):
+            self.setColormap(brane.lut)
+        self.scaleFilter = brane.scaleFilter
+        self.drawGradients = brane.drawGradients
+        self.gradStride = brane.gradStride
+        # tiles go to the other brane's workers, this one has none of its own
+        self.workers = brane.workers
+        self.executor = brane.fieldExecutor() if brane.workers > 1 else None
+        
+    def setColormap(self, cmap):
+        """
+        Color intensity with a colormap: a name from utils.Colormaps
+        or a lookup table of 256 RGB colors.
+        """
+        if(isinstance(cmap, str)):
+            cmap = colormaps[cmap]
+        self.lut = np.asarray(cmap, dtype=np.uint8)
+        if(self.lut.shape != (256,3)):
+            raise ValueError("Colormap needs 256 RGB colors.")
+        self.ampSurf.set_palette([tuple(c) for c in self.lut])
+        
+    def setScaleFilter(self, name: str):
+        """
+        Select how the brane is upscaled to the screen:
+        "smooth" (bilinear), "nearest" or "scale2x" (edge-aware doubling).
+        """
+        if(name not in self.scaleFilters):
+            raise ValueError(f"Unknown scale filter {name}.")
+        self.scaleFilter = name
+        
+    def cycleScaleFilter(self):
+        k = self.scaleFilters.index(self.scaleFilter)
+        self.setScaleFilter(self.scaleFilters[(k+1)%len(self.scaleFilters)])
+        
+    def scaleToScreen(self, src: pygame.Surface) -> pygame.Surface:
+        """
+        Upscale src into the persistent screen sized surface
+        with the selected filter.
+        """
+        factor = self.surfScale*self.view.zoom
+        size = (int(src.get_width()*factor), int(src.get_height()*factor))
+        if(self.surf is None or self.surf.get_size() != size):
+            self.surf = pygame.Surface(size, depth=32)
+        
+        if(self.scaleFilter == "smooth"):
+            pygame.transform.smoothscale(src, size, self.surf)
+        elif(self.scaleFilter == "nearest"):
+            pygame.transform.scale(src, size, self.surf)
+        else:
+            # double while that fits, then nearest for what is left
+            k = 0
+            w, h = src.get_size()
+            while(2*w <= size[0] and 2*h <= size[1]):
+                if((2*w, 2*h) == size):
+                    dest = self.surf
+                else:
+                    if(k == len(self.scale2xBufs)):
+                        self.scale2xBufs.append(None)
+                    dest = self.scale2xBufs[k]
+                    if(dest is None or dest.get_size() != (2*w, 2*h)):
+                        dest = pygame.Surface((2*w, 2*h), depth=32)
+                        self.scale2xBufs[k] = dest
+                pygame.transform.scale2x(src, dest)
+                src = dest
+                w, h = 2*w, 2*h
+                k += 1
+            if(src is not self.surf):
+                pygame.transform.scale(src, size, self.surf)
+        return(self.surf)
         
     def update(self, dt: float):
         """
-        Calculate sum of all wavelet intensities in the simulated region.
+        Advance all wavelets.
+        Intensity is only computed when it is needed for drawing.
+        """
+        self.tractors.update(dt)
+        for wl in self.wavelets[:]: # copy, as expired ones remove themselves
+            wl.update(dt)
+        self.elapsed += dt
+        
+        
+    def updateCoords(self):
+        """
+        Move the coordinate grid so it is centered on the view.
         """
         # move coords so they are centered on screen
         center_in_coords = self.simShape*self.surfScale*0.5
         offset = self.view.center - center_in_coords
-        self.coords = self.base_coords + offset
+        self.xs = self.base_xs + offset[0]
+        self.ys = self.base_ys + offset[1]
+        self.gridOrigin = offset
         
-        # warp coords into primary box image
+        # warp coords into primary box image, one axis at a time
         if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
-            self.coords = np.fmod(self.coords, GlobalRules.curUniverseSize)
-            self.coords[self.coords<0] += GlobalRules.curUniverseSize
-        
-        # update the intensity
-        self.I = np.zeros(self.simShape)
-        for wl in self.wavelets:
-            wl.update(dt)
-            self.I += wl.f(self.coords.reshape(-1,2)).reshape(self.simShape)
+            for axis in (self.xs, self.ys):
+                np.fmod(axis, GlobalRules.curUniverseSize, out=axis)
+                axis[axis<0] += GlobalRules.curUniverseSize
+            
+            
+    def refreshFields(self):
+        """
+        Recompute intensity (and gradient if drawn) on the grid,
+        unless they are already up to date for the wavelets and view.
+        Substeps between frames don't cost any field evaluations.
+        The versions count changes to the Tractors and to which other
+        wavelets are registered; those age with the simulation time.
+        """
+        key = (self.elapsed, self.tractors.version, self.wavelets.version,
+               tuple(self.view.center), self.drawGradients, self.gradStride,
+               tuple(self.simShape))
+        if(key == self.fieldsKey):
+            return
+        self.updateCoords()
+        if(self.drawGradients and self.gradStride > 1):
+            # gradient on a coarser grid, in its own pass
+            self.I = self.computeFieldsOnGrid(True, False)[0]
+            self.G = self.computeFieldsOnGrid(False, True, self.gradStride)[1]
+        else:
+            self.I, self.G = self.computeFieldsOnGrid(True, self.drawGradients)
+        self.fieldsKey = key
 
 
     def draw(self, view):
@@ -87,19 +269,29 @@ class Brane(pygame.sprite.Sprite):
         Draw to screen
         """
         if(view is not self.view): # view changed and Brane was not told!
-            # set new view, recalculate grid, and update intensity
+            # set new view and recalculate grid
             self.setView(view)
             self.calculateSimShape()
-            self.I = np.zeros(self.simShape)
-            for wl in self.wavelets:
-                self.I += wl.f(self.coords.reshape(-1,2)).reshape(self.simShape)
-        
-        if(self.I is None):
-            # We may have started paused, so no updates have occured yet
-            # Calculate intensity now.
-            self.I = np.zeros(self.simShape)
-            for wl in self.wavelets:
-                self.I += wl.f(self.coords.reshape(-1,2)).reshape(self.simShape)
+            self.fieldsKey = None
+        
+        if(self.pipeline is not None):
+            # show a finished layer from a few frames back
+            self.pipeline.submit(view)
+            front = self.pipeline.swap()
+            view.drawSurfToView(front.surf, front.view.center,
+                                view.LAYER_BRANE)
+            return
+        
+        self.render()
+        self.view.drawSurfToView(self.surf, view.center, view.LAYER_BRANE)
+        
+        
+    def render(self) -> pygame.Surface:
+        """
+        Paint the brane as seen from its view into the screen sized surface.
+        """
+        # evaluate intensity once per drawn frame
+        self.refreshFields()
                 
 #        # debug surf size
 #        self.I = np.zeros(self.simShape)
@@ -112,43 +304,143 @@ class Brane(pygame.sprite.Sprite):
 #        self.I[:,-5:-1] = 1
         
             
-        # re-paint the surface from simulation
-        amp_arr = np.floor(np.clip(256*(self.I*4.0+1)/2, 0,255)).astype(np.uint8)
-        amp_arr = np.repeat(amp_arr[:, :, np.newaxis], 3, axis=2)
-        amp_surf = pygame.surfarray.make_surface(amp_arr)
+        # re-paint the surface from simulation:
+        # quantize intensity into colormap indices,
+        # the palette lookup happens in the blit
+        amp = self.ampBuf
+        np.multiply(self.I, 512., out=amp) # 256*(I*4+1)/2
+        amp += 128.
+        np.clip(amp, 0., 255., out=amp)
+        idx = pygame.surfarray.pixels2d(self.ampSurf)
+        idx[...] = amp # truncation is floor for non-negative values
+        del idx # to unlock ampSurf and allow blit
+        amp_surf = self.rgbSurf
+        amp_surf.blit(self.ampSurf, (0,0))
         
         # gradients
         if(self.drawGradients):
-            gcoords = self.coords.reshape((-1,2))
-            grad_arr = self.computeForceAt(gcoords)
-            grad_arr = grad_arr.reshape((self.simShape[0],self.simShape[1],2))
-            grad_colors = np.zeros((self.simShape[0],self.simShape[1],3)).astype(np.uint8)
-            # x -> red
-            grad_colors[:,:,0] = np.floor(np.clip(256*(grad_arr[:,:,0]+1)/2, 0,255)).astype(np.uint8)
-            # y -> green
-            grad_colors[:,:,1] = np.floor(np.clip(256*(grad_arr[:,:,1]+1)/2, 0,255)).astype(np.uint8)
-            # alpha
-            grad_alpha = np.floor(np.clip(np.max(np.abs(grad_arr), axis=-1), 0.0, 0.1)*2550).astype(np.uint8)
-        
-            # new surface for gradient
-            grad_surf = pygame.Surface((self.simShape[0],self.simShape[1]), pygame.SRCALPHA, 32)
-            # Copy the rgb part of array to the new surface.
-            pygame.pixelcopy.array_to_surface(grad_surf, grad_colors)
-    
-            # overwrite grad_surf's alpha
-            gsa = np.array(grad_surf.get_view('A'), copy=False)
-            gsa[:,:] = grad_alpha
-            del gsa # to unlock grad_surf to allow blit 
-            
-            # draw onto intensity's surface
-            amp_surf.blit(grad_surf, grad_surf.get_rect())
+            self.paintGradients()
+            if(self.gradSurf.get_size() == amp_surf.get_size()):
+                amp_surf.blit(self.gradSurf, (0,0))
+            else:
+                size = amp_surf.get_size()
+                if(self.gradScaled is None or
+                   self.gradScaled.get_size() != size):
+                    self.gradScaled = pygame.Surface(size, pygame.SRCALPHA, 32)
+                pygame.transform.scale(self.gradSurf, size, self.gradScaled)
+                amp_surf.blit(self.gradScaled, (0,0))
 
         # transform into screen coords
-        self.surf = pygame.transform.smoothscale_by(
-                        amp_surf, self.surfScale*self.view.zoom)
+        return(self.scaleToScreen(amp_surf))
+        
+        
+    def paintGradients(self):
+        """
+        Write the force (negative gradient) into the persistent overlay:
+        x to red, y to green and magnitude to alpha.
+        """
+        shape = self.G.shape[:2]
+        if(self.gradSurf is None or self.gradSurf.get_size() != shape):
+            self.gradSurf = pygame.Surface(shape, pygame.SRCALPHA, 32)
+            self.gradSurf.fill((0,0,0,0))
+            self.gradBuf = np.zeros(shape)
+            self.gradBuf2 = np.zeros(shape)
+        buf = self.gradBuf
+        
+        rgb = pygame.surfarray.pixels3d(self.gradSurf)
+        for c in range(2): # 256*(-G+1)/2
+            np.multiply(self.G[:,:,c], -128., out=buf)
+            buf += 128.
+            np.clip(buf, 0., 255., out=buf)
+            rgb[:,:,c] = buf
+        del rgb # to unlock gradSurf to allow blit
         
-        # draw to screen
-        self.view.drawSurfToView(self.surf, view.center)
+        np.abs(self.G[:,:,0], out=buf)
+        np.maximum(buf, np.abs(self.G[:,:,1], out=self.gradBuf2), out=buf)
+        np.clip(buf, 0., 0.1, out=buf)
+        buf *= 2550.
+        alpha = pygame.surfarray.pixels_alpha(self.gradSurf)
+        alpha[...] = buf
+        del alpha # to unlock gradSurf to allow blit
+        
+        
+    def computeFieldsOnGrid(self, want_f: bool = True, want_grad: bool = False,
+                            stride: int = 1) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Compute summed wavelet intensity and/or its gradient
+        on the coordinate grid in one pass.
+        With several workers the grid is split into tiles of rows,
+        evaluated in parallel into their slices of shared buffers.
+        stride : use only every stride-th grid point along each axis.
+        Returns (I, G); fields that were not requested are None.
+        """
+        xs = self.xs[::stride]
+        ys = self.ys[::stride]
+        spacing = self.surfScale*stride
+        I = np.zeros((xs.size, ys.size)) if want_f else None
+        G = np.zeros((xs.size, ys.size, 2)) if want_grad else None
+        
+        if(self.workers == 1):
+            self.computeFieldsOnTile(xs, ys, spacing, 0, xs.size,
+                                     I, G, want_f, want_grad)
+            return(I, G)
+        
+        executor = self.fieldExecutor()
+        bounds = np.linspace(0, xs.size, self.workers*self.tilesPerWorker+1)
+        bounds = np.unique(bounds.astype(int))
+        tiles = [executor.submit(self.computeFieldsOnTile,
+                                 xs, ys, spacing, x0, x1,
+                                 I, G, want_f, want_grad)
+                 for x0, x1 in zip(bounds[:-1], bounds[1:])]
+        for t in tiles:
+            t.result() # wait, and re-raise anything that went wrong
+        return(I, G)
+        
+        
+    def computeFieldsOnTile(self, xs: npt.ArrayLike, ys: npt.ArrayLike,
+                            spacing: float, x0: int, x1: int,
+                            I: npt.ArrayLike, G: npt.ArrayLike,
+                            want_f: bool, want_grad: bool):
+        """
+        Evaluate fields on grid rows x0 to x1 (exclusive),
+        writing them into the same rows of I and G.
+        Wavelets are only evaluated inside their bounding boxes.
+        """
+        xs = xs[x0:x1]
+        origin = self.gridOrigin + np.array([x0*spacing, 0.])
+        tile_I, tile_G = self.tractors.evalGrid(xs, ys, origin, spacing,
+                                                want_f, want_grad)
+        if(want_f):
+            I = I[x0:x1]
+            I[...] = tile_I
+        if(want_grad):
+            G = G[x0:x1]
+            G[...] = tile_G
+        
+        uniSize = None
+        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+            uniSize = GlobalRules.curUniverseSize
+        for wl in self.wavelets:
+            box = wl.boundingBox()
+            if(box is None):
+                continue
+            # sub-rectangles of the tile covered by the box and its images
+            rx0, rx1, xvalid = periodicAxisRanges(box[[0]], box[[2]],
+                                                  origin[0], spacing,
+                                                  xs.size, uniSize)
+            ry0, ry1, yvalid = periodicAxisRanges(box[[1]], box[[3]],
+                                                  origin[1], spacing,
+                                                  ys.size, uniSize)
+            for a in np.flatnonzero(xvalid[0]):
+                for b in np.flatnonzero(yvalid[0]):
+                    rect = (slice(rx0[0,a], rx1[0,a]+1),
+                            slice(ry0[0,b], ry1[0,b]+1))
+                    sub_I, sub_G = wl.evalGrid(xs[rect[0]], ys[rect[1]],
+                                               want_f, want_grad)
+                    if(want_f):
+                        I[rect] += sub_I
+                    if(want_grad):
+                        G[rect] += sub_G
         
         
     def computeForceAt(self, x: npt.ArrayLike) -> npt.ArrayLike:
@@ -161,7 +453,27 @@ class Brane(pygame.sprite.Sprite):
             x[x<0] += GlobalRules.curUniverseSize
         
         # ask all wavelets for their force contributions
-        F = np.zeros(x.shape)
+        F = -self.tractors.eval(x.reshape(-1,2), False, True)[1].reshape(x.shape)
+        for wl in self.wavelets:
+            F -= wl.eval(x.reshape(-1,2), False, True)[1].reshape(x.shape)
+        return(F)
+    
+    def forceSnapshot(self, ahead: float = 0.) -> (dict, list):
+        """
+        Copy of the wavelets the forces depend on, as update(ahead)
+        would leave them: Tractor store columns and the other wavelets.
+        Shares nothing with the live wavelets, so it stays valid
+        while they change, e.g. when sent to another process.
+        """
+        tractors = self.tractors.snapshot()
+        tractors["lifetime"] += ahead
+        keep = tractors["lifetime"] <= tractors["maxLifetime"]
+        tractors = {name: col[keep] for name, col in tractors.items()}
+        
+        wavelets = []
         for wl in self.wavelets:
-            F -= wl.gradf(x.reshape(-1,2)).reshape(x.shape)
-        return(F)
\ No newline at end of file
+            wl = copy.deepcopy(wl) # without the brane, see __getstate__
+            wl.lifetime += ahead
+            if(wl.lifetime <= wl.maxLifetime):
+                wavelets.append(wl)
+        return(tractors, wavelets)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class ViewSnapshot():
+    """
+    The parts of a View a Brane reads while rendering, frozen at one frame,
+    so a render on another thread doesn't see the view move.
+    """
+    def __init__(self, view: "View"):
+        self.displaysurface = view.displaysurface
+        self.size = view.displaysurface.get_size()
+        self.center = np.array(view.center, dtype=float)
+        self.zoom = view.zoom
+
+
+class BranePipeline():
+    """
+    Renders the layer of a Brane on a background thread.
+    Every frame submit() hands a snapshot of the wavelets and the view to
+    the render thread, and swap() brings up the layer submitted latency
+    frames earlier, so the brane renders while the game draws sprites and UI.
+    Each render has its own stand-in Brane, which owns the surfaces it
+    renders into. Stand-ins are recycled once their layer was shown.
+    """
+    def __init__(self, brane: "Brane", latency: int = 1):
+        if(latency < 0):
+            raise ValueError("Pipeline latency can't be negative.")
+        self.brane = brane
+        self.latency = latency # frames a shown layer is behind
+        self.thread = None     # render thread, started on first use
+        self.inFlight = deque() # (future, stand-in) in submission order
+        self.idle = []          # stand-ins free for the next render
+        self.front = None       # stand-in whose layer is shown
+
+    def submit(self, view: "View"):
+        """
+        Start rendering the brane as it is now, seen from view.
+        """
+        snap = ViewSnapshot(view)
+        if(self.idle):
+            shadow = self.idle.pop()
+            size = shadow.view.size
+            shadow.setView(snap)
+            if(size != snap.size):
+                shadow.calculateSimShape()
+        else:
+            shadow = type(self.brane)(self.brane.surfScale, snap)
+        shadow.loadState(self.brane)
+
+        if(self.thread is None):
+            self.thread = ThreadPoolExecutor(max_workers=1,
+                                             thread_name_prefix="brane render")
+        self.inFlight.append((self.thread.submit(shadow.render), shadow))
+
+    def swap(self) -> "Brane":
+        """
+        Wait for the renders that are more than latency frames old
+        and bring up the newest of them.
+        Returns the stand-in whose layer should be shown.
+        """
+        while(self.inFlight and
+              (len(self.inFlight) > self.latency or self.front is None)):
+            future, shadow = self.inFlight.popleft()
+            future.result() # re-raise anything that went wrong
+            if(self.front is not None):
+                self.idle.append(self.front)
+            self.front = shadow
+        return(self.front)
+
+    def shutdown(self):
+        """
+        Wait for the renders in flight and stop the render thread.
+        It is restarted by the next submit().
+        """
+        if(self.thread is not None):
+            self.thread.shutdown(wait=True)
+            self.thread = None
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import numpy.typing as npt
+import BraneSpace.core.GlobalRules as GlobalRules
+from BraneSpace.entities.Entity import Entity
+from BraneSpace.utils.Geometry import interpolateStep
+
+
+class EntityStore:
+    """
+    Struct-of-arrays storage of the physical state of all registered Entities.
+    Registered Entities are thin views onto their slot in this store,
+    so all of them can be integrated in one vectorized step.
+    """
+    # per-entity columns and their trailing shapes
+    columns = {"r": (2,), "v": (2,), "a": (2,), "dr": (2,),
+               "mass": (), "dragCoef": (), "theta": (), "rot_vel": (),
+               "collisionRadius": ()}
+    # per-entity flags
+    flagColumns = ("alive",)
+    # columns entities don't see: total force from the last step,
+    # whether the entity overrides calcForce and whether it collides
+    internalColumns = {"F": ((2,), float), "customForce": ((), bool),
+                       "collides": ((), bool)}
+    # columns written by integrate()
+    integrated = ("r", "v", "a", "dr", "F", "theta")
+
+    def __init__(self, capacity: int = 128):
+        self.n = 0          # number of stored entities
+        self.owners = []    # entity objects, indexed by slot
+        self.version = 0    # bumped when entities write their fields
+        self.capacity = 0
+        self.beforeChange = None # called before slots are added or removed
+        self.reserve(capacity)
+
+    @classmethod
+    def fromColumns(cls, columns: dict, n: int) -> "EntityStore":
+        """
+        Store of n entities over existing column arrays, without owners.
+        Used by the simulation process, which only integrates them.
+        """
+        store = cls.__new__(cls)
+        store.__dict__.update(columns)
+        store.n = n
+        store.owners = []
+        store.capacity = columns["r"].shape[0]
+        store.beforeChange = None
+        return(store)
+
+    def __len__(self):
+        return(self.n)
+
+    def allColumns(self):
+        """
+        Names, trailing shapes and dtypes of all columns.
+        """
+        for name, shape in self.columns.items():
+            yield(name, shape, float)
+        for name in self.flagColumns:
+            yield(name, (), bool)
+        for name, (shape, dtype) in self.internalColumns.items():
+            yield(name, shape, dtype)
+
+    def reserve(self, capacity: int):
+        """
+        Grow the columns so they can hold at least capacity entities.
+        """
+        if(capacity <= self.capacity):
+            return
+        if(self.beforeChange is not None):
+            self.beforeChange()
+        for name, shape, dtype in self.allColumns():
+            new = np.zeros((capacity,)+shape, dtype=dtype)
+            if(self.capacity > 0):
+                new[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def add(self, e: "Entity"):
+        """
+        Copy an entity's state into a new slot and
+        make the entity a view onto it.
+        """
+        if(e._store is self):
+            return
+        if(self.beforeChange is not None):
+            self.beforeChange()
+        if(self.n == self.capacity):
+            self.reserve(2*self.capacity)
+        slot = self.n
+        for name in self.columns:
+            getattr(self, name)[slot] = getattr(e, name, 0.)
+        for name in self.flagColumns:
+            getattr(self, name)[slot] = getattr(e, name)
+        self.F[slot] = 0.
+        self.customForce[slot] = type(e).calcForce is not Entity.calcForce
+        self.collides[slot] = e.collides
+
+        # switch entity's fields over to the store
+        e._store = self
+        e._slot = slot
+        self.owners.append(e)
+        self.n += 1
+
+    def remove(self, e: "Entity"):
+        """
+        Remove an entity by moving the last one into its slot.
+        Does nothing if the entity is not in this store.
+        """
+        if(e._store is not self):
+            return
+        if(self.beforeChange is not None):
+            self.beforeChange()
+        slot = e._slot
+        self.detach(e)
+
+        last = self.n - 1
+        if(slot != last):
+            for name, shape, dtype in self.allColumns():
+                col = getattr(self, name)
+                col[slot] = col[last]
+            moved = self.owners[last]
+            moved._slot = slot
+            self.owners[slot] = moved
+        self.owners.pop()
+        self.n = last
+
+    def detach(self, e: "Entity"):
+        """
+        Copy slot values back into the entity, so it stays usable
+        after it leaves the store.
+        """
+        for name in self.columns:
+            value = getattr(self, name)[e._slot]
+            e.__dict__[name] = value.copy() if np.ndim(value) else value.item()
+        for name in self.flagColumns:
+            e.__dict__[name] = getattr(self, name)[e._slot].item()
+        e._store = None
+        e._slot = None
+
+    def clear(self):
+        """
+        Remove all entities.
+        """
+        if(self.beforeChange is not None):
+            self.beforeChange()
+        for e in self.owners:
+            self.detach(e)
+        self.owners = []
+        self.n = 0
+
+    def customForces(self) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Slots of entities that override calcForce and what they add
+        to the brane force of the last step.
+        """
+        slots = np.flatnonzero(self.customForce[:self.n])
+        extra = np.zeros((slots.size,2))
+        for i, k in enumerate(slots):
+            extra[i] = self.owners[k].calcForce() - self.F[k]
+        return(slots, extra)
+
+    def integrate(self, dt: float, brane: "Brane",
+                  custom: (npt.ArrayLike, npt.ArrayLike) = None):
+        """
+        Velocity Verlet step for all stored entities at once.
+        Brane forces for every entity come from one computeForceAt call.
+        Entities that override calcForce add their own forces to it.
+        custom : (slots, extra forces) to add instead of calling calcForce,
+                 for stores whose owners live in another process.
+        """
+        n = self.n
+        if(n == 0):
+            return
+        r = self.r[:n]
+        v = self.v[:n]
+        a = self.a[:n]
+        dr = self.dr[:n]
+        F = self.F[:n]
+
+        # force
+        F[:] = brane.computeForceAt(r.copy())
+        if(custom is None):
+            for k in np.flatnonzero(self.customForce[:n]):
+                F[k] = self.owners[k].calcForce()
+        else:
+            F[custom[0]] += custom[1]
+
+        # acelleration
+        aNext = F/self.mass[:n,np.newaxis]
+        # drag
+        aNext -= self.dragCoef[:n,np.newaxis] * np.abs(v)*v
+        # velocity verlet
+        np.add(v*dt, 0.5*a, out=dr)
+
+        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+            # limit movement to 1/4 a periodic box/update
+            np.clip(dr, -0.25*GlobalRules.curUniverseSize,
+                    0.25*GlobalRules.curUniverseSize, out=dr)
+
+        v += 0.5*dt*(a+aNext) # drag limits max v
+
+        r += dr
+        a[:] = aNext
+
+        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+            np.fmod(r, GlobalRules.curUniverseSize, out=r)
+            r[r<0] += GlobalRules.curUniverseSize
+
+        # rotation
+        self.theta[:n] -= dt*self.rot_vel[:n]
+
+    def interpolatedPositions(self, alpha: float) -> npt.ArrayLike:
+        """
+        Positions of all entities a fraction alpha of the way from the
+        previous step to the current one, see interpolateStep.
+        """
+        n = self.n
+        return(interpolateStep(self.r[:n], self.dr[:n], alpha))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+class FixedTimestep():
+    """
+    Game loop scheduler running the simulation in steps of a fixed length,
+    however long the frames are.
+    Frame time goes into an accumulator and every whole step in it is run.
+    The remainder carries over to the next frame, and alpha says how far
+    the frame is past the last step, to draw between the last two states.
+    At most maxSteps run in one frame. Time beyond that is dropped, so a
+    slow machine runs the game slower instead of falling further behind.
+    """
+    def __init__(self, dt: float, maxSteps: int = 4):
+        if(dt <= 0):
+            raise ValueError("Time step has to be positive.")
+        if(maxSteps < 1):
+            raise ValueError("Need to allow at least one step per frame.")
+        self.dt = dt               # simulated time per step, ms
+        self.maxSteps = maxSteps   # catch-up budget per frame
+        self.accumulator = 0.      # frame time not simulated yet, ms
+        self.dropped = 0.          # frame time skipped over the budget, ms
+
+    def advance(self, frameTime: float) -> int:
+        """
+        Add the time a frame took and return how many steps to run for it.
+        """
+        self.accumulator += frameTime
+        steps = int(self.accumulator // self.dt)
+        if(steps > self.maxSteps):
+            # keep the fraction of a step, so alpha stays continuous
+            late = (steps - self.maxSteps)*self.dt
+            self.accumulator -= late
+            self.dropped += late
+            steps = self.maxSteps
+        self.accumulator -= steps*self.dt
+        return(steps)
+
+    @property
+    def alpha(self) -> float:
+        """
+        Fraction of a step the simulation owes the screen, in [0,1).
+        """
+        return(self.accumulator/self.dt)
+
+    def reset(self):
+        """
+        Forget accumulated time, e.g. after a pause or a new game.
+        """
+        self.accumulator = 0.
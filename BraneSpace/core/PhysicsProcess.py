@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import traceback
+import BraneSpace.core.GlobalRules as GlobalRules
+from BraneSpace.core.Brane import Brane
+from BraneSpace.core.EntityStore import EntityStore
+from BraneSpace.utils.SharedArena import SharedArena
+from BraneSpace.wavelets.TractorStore import TractorStore
+
+
+class BraneForces():
+    """
+    Stand-in for a Brane in the simulation process.
+    Holds just the wavelets needed for the forces on entities.
+    """
+    def __init__(self):
+        self.tractors = TractorStore()
+        self.wavelets = []
+
+    # same force evaluation as on the real brane
+    computeForceAt = Brane.computeForceAt
+
+
+def simulationStep(buffers: dict, forces: BraneForces, dt: float, n: int,
+                   rules: tuple, tractors: dict, wavelets: list,
+                   custom: tuple):
+    """
+    Integrate the first n entities from their current state into the next.
+    """
+    GlobalRules.pbc, GlobalRules.curUniverseSize = rules
+    forces.tractors.loadSnapshot(tractors)
+    forces.wavelets = wavelets
+
+    nxt = {}
+    for name, buf in buffers.items():
+        buf[1,:n] = buf[0,:n]
+        nxt[name] = buf[1]
+    store = EntityStore.fromColumns(nxt, n)
+    store.integrate(dt, forces, custom)
+
+
+def simulationLoop(commands: multiprocessing.Queue,
+                   results: multiprocessing.Queue):
+    """
+    Main loop of the simulation process.
+    Attaches to the arena of a SharedEntityStore and steps its entities
+    whenever asked to, until told to stop or the game process is gone.
+    """
+    # SDL's handlers were inherited with the fork: let terminate() work
+    # and leave Ctrl+C to the game process, which shuts us down
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    parent = os.getppid()
+    
+    arena = None
+    forces = BraneForces()
+    while(True):
+        try:
+            msg = commands.get(timeout=1.)
+        except queue.Empty:
+            if(os.getppid() != parent):
+                break
+            continue
+        if(msg[0] == "stop"):
+            break
+        try:
+            if(msg[0] == "attach"):
+                if(arena is not None):
+                    arena.close()
+                arena = SharedArena.attach(msg[1])
+            elif(msg[0] == "step"):
+                simulationStep(arena.arrays, forces, *pickle.loads(msg[1]))
+                results.put(("done",))
+        except Exception:
+            results.put(("error", traceback.format_exc()))
+
+    # the game process unlinks the arena
+    if(arena is not None):
+        arena.close()
+
+
+class PhysicsProcess():
+    """
+    Runs entity integration and brane forces for a SharedEntityStore
+    in a simulation process.
+    Game logic stays in the game process: entity update(), collisions,
+    spawns and drawing. Collisions are found there after update(),
+    which can change collision radii and kill entities.
+    A step started with start() runs while the game draws the current
+    state; join() waits for it and publishes the integrated state.
+    Store changes join first, see beforeChange.
+    Only entity counts and wavelet parameters go through the queues,
+    entity state stays in the store's shared arena.
+    Needs the fork start method, so the game module isn't run again.
+    """
+    def __init__(self, store: "SharedEntityStore"):
+        ctx = multiprocessing.get_context("fork")
+        self.store = store
+        self.commands = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=simulationLoop,
+                                   args=(self.commands, self.results),
+                                   name="BraneSpace physics", daemon=True)
+        self.process.start()
+
+        self.generation = None  # store arena the process is attached to
+        self.pending = False    # started step not yet used by an update
+        self.sent = None        # pickled inputs of the started step
+        self.inFlight = False   # started step not yet joined
+        self.n = 0              # entities in the started step
+
+    @staticmethod
+    def supported() -> bool:
+        return("fork" in multiprocessing.get_all_start_methods())
+
+    def stepInputs(self, dt: float, brane: "Brane", ahead: float) -> tuple:
+        """
+        Everything a step depends on besides the entity state,
+        with the brane as its update(ahead) would leave it.
+        """
+        rules = (GlobalRules.pbc, GlobalRules.curUniverseSize)
+        tractors, wavelets = brane.forceSnapshot(ahead)
+        return((dt, len(self.store), rules, tractors, wavelets,
+                self.store.customForces()))
+
+    def start(self, dt: float, brane: "Brane", ahead: float = 0.):
+        """
+        Start a step of all entities in the simulation process.
+        ahead : time the brane still has to be updated by before the step,
+                when starting it ahead of time.
+        Does nothing if one was already started and not used yet.
+        """
+        if(self.pending):
+            return
+        store = self.store
+        if(self.generation != store.generation):
+            self.commands.put(("attach", store.layout()))
+            self.generation = store.generation
+
+        # pickled right away, so the game can go on changing its state,
+        # and kept to check the guess of a step started ahead
+        self.sent = pickle.dumps(self.stepInputs(dt, brane, ahead))
+        self.commands.put(("step", self.sent))
+        self.n = len(store)
+        self.pending = True
+        self.inFlight = True
+
+    def join(self):
+        """
+        Wait for the started step, if any, and publish its integrated state.
+        """
+        if(not self.inFlight):
+            return
+        self.receive()
+        self.inFlight = False
+        self.store.publishNext(self.n)
+
+    def step(self, dt: float, brane: "Brane"):
+        """
+        Finish a step for an update: the one started ahead of time,
+        or a new one run right now.
+        A step started ahead is redone if it guessed wrong what the update
+        would see, e.g. the player steered meanwhile, unless a store change
+        already had to publish it.
+        """
+        if(self.pending and self.inFlight and
+           pickle.dumps(self.stepInputs(dt, brane, 0.)) != self.sent):
+            self.receive() # drop its result, the current state stays
+            self.inFlight = False
+            self.pending = False
+        if(not self.pending):
+            self.start(dt, brane)
+        self.join()
+        self.pending = False
+
+    def discard(self):
+        """
+        Finish any started step, so no update uses it.
+        """
+        self.join()
+        self.pending = False
+
+    def receive(self) -> tuple:
+        while(True):
+            try:
+                msg = self.results.get(timeout=1.)
+            except queue.Empty:
+                if(not self.process.is_alive()):
+                    raise RuntimeError("Simulation process died.") from None
+                continue
+            if(msg[0] == "error"):
+                raise RuntimeError("Simulation process failed:\n" + msg[1])
+            return(msg)
+
+    def stop(self):
+        """
+        Finish the current step and end the simulation process.
+        """
+        if(self.process is None):
+            return
+        if(self.process.is_alive()):
+            self.discard()
+            self.commands.put(("stop",))
+            self.process.join(timeout=5.)
+            if(self.process.is_alive()):
+                self.process.terminate()
+                self.process.join()
+        self.commands.close()
+        self.results.close()
+        self.process = None
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+class Registry():
+    """
+    List of registered objects with O(1) append, membership test and removal.
+    An index map tracks the position of every object. Removal moves the last
+    object into the freed position, so the order of the remaining objects
+    is not preserved beyond the first one that was never removed.
+    Ordered registries keep the registration order instead, for lists whose
+    order matters like the drawing order. Their removal is O(n), so
+    batches should go through removeMany().
+    Iterate over a copy ([:]) if objects can be removed during iteration.
+    version is bumped whenever objects are registered or unregistered.
+    """
+    def __init__(self, ordered: bool = False):
+        self.items = []     # registered objects
+        self.index = {}     # object -> position in items
+        self.ordered = ordered # keep registration order on removal
+        self.version = 0
+
+    def __len__(self):
+        return(len(self.items))
+
+    def __iter__(self):
+        return(iter(self.items))
+
+    def __getitem__(self, key):
+        return(self.items[key])
+
+    def __contains__(self, obj):
+        return(obj in self.index)
+
+    def append(self, obj):
+        """
+        Register an object. Does nothing if it is already registered.
+        """
+        if(obj in self.index):
+            return
+        self.index[obj] = len(self.items)
+        self.items.append(obj)
+        self.version += 1
+
+    add = append
+
+    def remove(self, obj):
+        """
+        Unregister an object by moving the last one into its position,
+        or by shifting the later ones down if ordered.
+        Raises ValueError if the object is not registered.
+        """
+        pos = self.index.pop(obj, None)
+        if(pos is None):
+            raise ValueError("Object is not registered.")
+        self.version += 1
+        if(self.ordered):
+            del self.items[pos]
+            for k in range(pos, len(self.items)):
+                self.index[self.items[k]] = k
+            return
+        last = self.items.pop()
+        if(last is not obj):
+            self.items[pos] = last
+            self.index[last] = pos
+
+    def discard(self, obj):
+        """
+        Unregister an object if it is registered.
+        """
+        if(obj in self.index):
+            self.remove(obj)
+
+    def removeMany(self, objs):
+        """
+        Unregister those of objs that are registered.
+        An ordered registry is compacted once for the whole batch.
+        """
+        if(not self.ordered):
+            for obj in objs:
+                self.discard(obj)
+            return
+        first = len(self.items)
+        for obj in objs:
+            pos = self.index.pop(obj, None)
+            if(pos is not None):
+                first = min(first, pos)
+        if(first == len(self.items)):
+            return
+        self.version += 1
+        self.items[first:] = [o for o in self.items[first:] if o in self.index]
+        for k in range(first, len(self.items)):
+            self.index[self.items[k]] = k
+
+    def clear(self):
+        self.items.clear()
+        self.index.clear()
+        self.version += 1
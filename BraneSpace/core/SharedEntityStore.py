@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from BraneSpace.core.EntityStore import EntityStore
+from BraneSpace.utils.SharedArena import SharedArena
+
+
+class SharedEntityStore(EntityStore):
+    """
+    EntityStore with all columns in one shared memory arena,
+    so a simulation process can integrate the entities.
+    Every column has two copies: the current state that the game logic and
+    drawing use, and the next state that the simulation process writes
+    meanwhile. See PhysicsProcess.
+    Rows are slots, packed by moving the last entity into a freed slot,
+    so slot numbers are all another process needs to refer to entities.
+    """
+    def __init__(self, capacity: int = 1024):
+        self.arena = None
+        self.buffers = {}   # column name -> [current, next] array
+        self.retired = []   # outgrown arenas, not closed yet
+        self.generation = 0 # bumped whenever columns move to a new arena
+        super().__init__(capacity)
+
+    def reserve(self, capacity: int):
+        """
+        Grow the columns so they can hold at least capacity entities.
+        Columns move to a new arena, so a simulation process
+        has to reattach after this.
+        """
+        if(capacity <= self.capacity):
+            return
+        if(self.beforeChange is not None):
+            self.beforeChange()
+        arena = SharedArena({name: ((2,capacity)+shape, dtype)
+                             for name, shape, dtype in self.allColumns()})
+        for name, shape, dtype in self.allColumns():
+            buf = arena.arrays[name]
+            if(self.capacity > 0):
+                buf[0,:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, buf[0])
+
+        if(self.arena is not None):
+            self.arena.unlink() # nobody can attach anymore, close once unused
+            self.retired.append(self.arena)
+        self.arena = arena
+        self.buffers = arena.arrays
+        self.capacity = capacity
+        self.generation += 1
+        self.closeRetired()
+
+    def closeRetired(self):
+        """
+        Close outgrown arenas that are no longer in use.
+        """
+        self.retired = [a for a in self.retired if not a.close()]
+
+    def layout(self) -> tuple:
+        """
+        Layout of the arena, for attaching to it from another process.
+        """
+        return(self.arena.layout())
+
+    def publishNext(self, n: int, names: tuple = EntityStore.integrated):
+        """
+        Copy the next state of the first n slots into the current one.
+        """
+        for name in names:
+            buf = self.buffers[name]
+            buf[0,:n] = buf[1,:n]
+
+    def release(self):
+        """
+        Free the shared memory. Entities should be removed first,
+        the store can't be used afterwards.
+        """
+        for name, shape, dtype in self.allColumns():
+            setattr(self, name, None)
+        self.buffers = {}
+        if(self.arena is not None):
+            self.arena.unlink()
+            self.retired.append(self.arena)
+            self.arena = None
+        self.closeRetired()
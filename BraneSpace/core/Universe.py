@@ -6,17 +6,27 @@ Created on Fri May 10 13:49:55 2024
 @author: zetadin
 """
 
+import numpy as np
 import pygame
 import BraneSpace.core.GlobalRules as GlobalRules
 from BraneSpace.core.Brane import Brane
+from BraneSpace.core.EntityStore import EntityStore
+from BraneSpace.core.SharedEntityStore import SharedEntityStore
+from BraneSpace.core.PhysicsProcess import PhysicsProcess
+from BraneSpace.core.Registry import Registry
+from BraneSpace.utils.ObjectPool import releaseToPool
+from BraneSpace.utils.Collisions import collisionPairs
 
 
 class Universe():
     def __init__(self, view: "View", parallel: bool = False,
-                 braneSurfScale: float = 4.):
+                 braneSurfScale: float = 4., braneWorkers: int = 1):
         if(braneSurfScale<=0):
             raise ValueError("braneSurfScale has to be a positive.")
+        if(braneWorkers<1):
+            raise ValueError("braneWorkers has to be at least 1.")
         self.braneSurfScale = braneSurfScale
+        self.braneWorkers = braneWorkers # threads evaluating the brane
         self.parallel = parallel
         self.view = view
         
@@ -24,20 +34,29 @@ class Universe():
         # situations where you redraw only parts of the screen.
         # Here we redraw everything every frame becasue of the motion.
         # It's more efficient to use simple lists.
+        # Registries are lists with O(1) removal of arbitrary objects.
         
         #self.drawables = pygame.sprite.Group()
-        self.drawables = []
-        self.updatables = []
-        self.collectables = []
-        self.collidables = []
+        self.drawables = Registry(ordered=True) # drawing order
+        self.updatables = Registry()
+        self.collectables = Registry()
+        self.collidables = Registry()
         
-        self.reset()
-        
-        # if we use multiple cores, create a shared memory
-        # to hold entity positions and velocities
-        # as they will be updated in the physics process
+        # physical state of all registered entities
+        # If we use multiple cores, it is kept in shared memory,
+        # as it will be integrated in the physics process.
+        self.physics = None
         if(self.parallel):
-            pass
+            if(not PhysicsProcess.supported()):
+                raise RuntimeError("Parallel physics needs the fork start method.")
+            self.entities = SharedEntityStore()
+            self.physics = PhysicsProcess(self.entities)
+            # don't change slots while the physics process uses them
+            self.entities.beforeChange = self.physics.join
+        else:
+            self.entities = EntityStore()
+        
+        self.reset()
         
     def reset(self):
         """
@@ -47,12 +66,19 @@ class Universe():
         self.paused = True
         self.view.debug = False
         
+        if(self.physics is not None):
+            self.physics.discard()
+        
         #self.drawables.empty()
         self.drawables.clear()
         self.updatables.clear()
         self.collectables.clear()
         self.collidables.clear()
-        self.destroy_these_collidables=[]
+        self.entities.clear()
+        
+        # command buffer, applied by commit()
+        self.spawn_these=[]
+        self.destroy_these_collidables=[] # any entity, not only collidables
         
         if(GlobalRules.mode == GlobalRules.GameMode.ASTEROIDS):
             GlobalRules.pbc = GlobalRules.PBC.TOROIDAL
@@ -61,8 +87,15 @@ class Universe():
             GlobalRules.pbc = GlobalRules.PBC.NONE
             GlobalRules.curUniverseSize = None
             
-        # Create a new brane with no wavelets
-        self.brane = Brane(self.braneSurfScale, self.view)
+        # Create a new brane with no wavelets, keeping display settings
+        old = getattr(self, "brane", None)
+        self.brane = Brane(self.braneSurfScale, self.view, self.braneWorkers)
+        if(old is not None):
+            self.brane.setScaleFilter(old.scaleFilter)
+            self.brane.setColormap(old.lut)
+            if(old.pipeline is not None):
+                self.brane.setPipelined(True, old.pipeline.latency)
+            old.shutdown()
         self.brane.parentUniverse = self
         # register brane here to avoid a circular import
         #self.drawables.add(self.brane)
@@ -70,6 +103,91 @@ class Universe():
         self.updatables.append(self.brane)
         
         
+    def setBraneWorkers(self, workers: int):
+        """
+        Set the number of threads evaluating the brane,
+        now and for branes created by later resets.
+        """
+        self.brane.setWorkers(workers)
+        self.braneWorkers = workers
+        
+    def update(self, dt: float):
+        """
+        Advance the simulation by dt.
+        Wavelets first, then physics of all entities in one vectorized step,
+        then the per-entity logic in their update() methods.
+        In parallel mode the physics step runs in the physics process,
+        or was already started there by startPhysicsStep().
+        """
+        self.brane.update(dt)
+        if(self.physics is not None):
+            self.physics.step(dt, self.brane)
+        else:
+            self.entities.integrate(dt, self.brane)
+        
+        # spawns and destruction are deferred to commit()
+        for e in self.updatables:
+            if(e is not self.brane):
+                e.update(dt)
+        
+        
+    def startPhysicsStep(self, dt: float):
+        """
+        In parallel mode, start the physics of the next update in the
+        physics process, so it runs while this frame is drawn.
+        Does nothing in serial mode.
+        """
+        if(self.physics is not None):
+            # the brane is updated before the step uses it
+            self.physics.start(dt, self.brane, ahead=dt)
+        
+        
+    def shutdown(self):
+        """
+        Stop the brane's threads and the physics process
+        and free the shared memory. Call before exiting.
+        """
+        self.brane.shutdown()
+        if(self.physics is not None):
+            self.physics.stop()
+            self.entities.beforeChange = None
+            self.entities.clear()
+            self.entities.release()
+            self.physics = None
+        
+        
+    def requestSpawn(self, e: "Entity"):
+        """
+        Queue an entity to be registered with the brane on the next commit.
+        """
+        self.spawn_these.append(e)
+        
+        
+    def requestDestroy(self, e: "Entity"):
+        """
+        Queue an entity for removal on the next commit.
+        It stops colliding and being collected right away.
+        """
+        if(e.alive):
+            e.alive = False
+            self.destroy_these_collidables.append(e)
+        
+        
+    def commit(self):
+        """
+        Apply all queued destruction and spawns in one batch.
+        Call once per step, after update, collision detection and pickup,
+        so no list is modified while something iterates over it.
+        """
+        self.fastDestroyRequested()
+        
+        if(self.spawn_these):
+            self.entities.reserve(len(self.entities) + len(self.spawn_these))
+            for e in self.spawn_these:
+                e.register(self.brane)
+            self.spawn_these=[]
+        
+        
     def destroyRequested(self):
         """
         Destroy entities after the update step.
@@ -83,20 +201,76 @@ class Universe():
     def fastDestroyRequested(self):
         """
         Destroy entities after the update step.
-        Instead of removing individual entities creates new lists
-        for the ones to keep. Should be faster.
+        Unregisters all requested entities in one batch without
+        per-entity bookkeeping, so cost is O(number destroyed), plus one
+        pass over the drawables to keep their order.
         Needs to be after update to avoid iterating through a missing entity.
-        """            
-            
-        self.collidables = [e for e in self.collidables if e not in self.destroy_these_collidables]
-        self.updatables = [e for e in self.updatables if e not in self.destroy_these_collidables]
-        #self.drawables.remove(self.destroy_these_collidables)
-        self.drawables = [e for e in self.drawables if e not in self.destroy_these_collidables]
+        """
+        destroyed = self.destroy_these_collidables
+        self.collidables.removeMany(destroyed)
+        self.collectables.removeMany(destroyed)
+        self.updatables.removeMany(destroyed)
+        self.drawables.removeMany(destroyed)
+        for e in destroyed:
+            self.entities.remove(e)
+            releaseToPool(e) # recycled by the next spawn of its class
         
         self.destroy_these_collidables=[]
         
         
     def collisionDetect(self, dt):
+        """
+        Detect and handle collisions between all collidables.
+        A spatial hash broadphase picks the pairs that can possibly touch
+        in this step and a vectorized segment-circle test checks them all
+        at once. collidedWith is only dispatched for the hits.
+        Also in parallel mode this runs here, on the collision radii and
+        alive flags update() left.
+        Spawns and destruction requested by collidedWith wait for commit().
+        """
+        n = len(self.collidables)
+        ci = cj = np.zeros(0, dtype=int)
+        if(n > 1):
+            r = np.empty((n,2))
+            dr = np.empty((n,2))
+            radius = np.empty(n)
+            for k, c in enumerate(self.collidables):
+                r[k] = c.r
+                dr[k] = c.dr
+                radius[k] = c.collisionRadius
+            uniSize = None
+            if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+                uniSize = GlobalRules.curUniverseSize
+            ci, cj = collisionPairs(r, dr, radius, uniSize)
+        self.dispatchHits(self.collidables, ci, cj, dt)
+        
+        
+    def dispatchHits(self, colls, ci, cj, dt):
+        """
+        Call collidedWith for the hit pairs (colls[ci], colls[cj]),
+        in the same order as the all-pairs loop.
+        """
+        hits = [[] for i in range(len(colls))] # hit partners j>i of each
+        for i, j in zip(ci.tolist(), cj.tolist()):
+            hits[i].append(j)
+        
+        for i in range(len(colls)-1):
+            si = colls[i]
+            if(si.alive): # don't check collidables that are already destoyed
+                for j in hits[i]:
+                    sj = colls[j]
+                    if(sj.alive):
+                        # confirm outer circle hits with finer shapes
+                        if(not si.refinesCollision or si.checkCollision(sj, dt)):
+                            si.collidedWith(sj)
+                            sj.collidedWith(si)
+                            break
+        
+        
+    def collisionDetectAllPairs(self, dt):
+        """
+        Reference collision detection that checks every pair.
+        """
         # check for all collidable-collidable pairs
         for i in range(len(self.collidables)-1):
             si = self.collidables[i]
@@ -108,8 +282,6 @@ class Universe():
                             si.collidedWith(sj)
                             sj.collidedWith(si)
                             break
-                    
-        self.fastDestroyRequested()
             
         
             
@@ -10,6 +10,8 @@ import numpy as np
 import BraneSpace.core.GlobalRules as GlobalRules
 from BraneSpace.entities.Entity import SpriteEntity
 from BraneSpace.utils.Geometry import rotMat, expandPeriodicImages
+from BraneSpace.utils.Collisions import sweptCircleHits
+from BraneSpace.utils.StoreField import StoreField
 
 class Collidable(SpriteEntity):
     """
@@ -17,15 +19,16 @@ class Collidable(SpriteEntity):
     is used to detect collisions between them by
     Segment-Circle overlap crossing.
     """
+    # Does checkCollision() do more than the outer circle test?
+    # If so, hits of the batched narrow phase are confirmed with it.
+    refinesCollision = False
+    collides = True
+    collisionRadius = StoreField()
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.collisionRadius = 0.5*self.size
         
-        # Should we take part in colision detection.
-        # Set to False when requesting destruction.
-        self.alive = True
-        
     
     def register(self, brane: "Brane"):
         """Add to the list of objects in the universe."""
@@ -97,12 +100,10 @@ class Collidable(SpriteEntity):
         Every collidable is responcible for it's own marking.
         """
         
-        if self in self.parentBrane.parentUniverse.collidables:
-            self.parentBrane.parentUniverse.collidables.remove(self)
-        if self in self.parentBrane.parentUniverse.updatables:
-            self.parentBrane.parentUniverse.updatables.remove(self)
-        if self in self.parentBrane.parentUniverse.drawables:
-            self.parentBrane.parentUniverse.drawables.remove(self)
+        self.parentBrane.parentUniverse.collidables.discard(self)
+        self.parentBrane.parentUniverse.updatables.discard(self)
+        self.parentBrane.parentUniverse.drawables.discard(self)
+        self.parentBrane.parentUniverse.entities.remove(self)
         
         
     def draw(self, view):
@@ -116,33 +117,86 @@ class Collidable(SpriteEntity):
             # rough collision circle
             collision_color = (168, 81, 245) # light purple
             
-            if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
-                # if PBC, then draw colision circles for every image on screen
-                
-                # find visible periodic images and their coords
-                vis, pos = self.periodic_images # read cached values
-                for im in range(vis.shape[0]):
-                    if(vis[im]): # only draw if image on screen
-                        view.drawCircleToView(collision_color, pos[im],
-                                              self.collisionRadius, 2)
-            else:
-                # without PBC, just draw the collision circles in primary cell
-                view.drawCircleToView(collision_color, self.r,
-                                      self.collisionRadius, 2)
+            # draw colision circles for every image on screen,
+            # just the one in the primary cell without PBC
+            vis, pos = self.periodic_images # read cached values
+            for im in range(vis.shape[0]):
+                if(vis[im]): # only draw if image on screen
+                    view.drawCircleToView(collision_color, pos[im],
+                                          self.collisionRadius, 2)
 
 
+class CollisionProxy():
+    """
+    Lightweight stand-in for a Collidable in collision checks:
+    just a circle that moved by dr this step.
+    Used for the parts of MultiPartCollidables.
+    """
+    __slots__ = ("r", "v", "dr", "collisionRadius")
+    refinesCollision = False
+    
+    def __init__(self):
+        self.r = np.zeros(2)
+        self.v = np.zeros(2)
+        self.dr = np.zeros(2) # parts are checked as stationary circles
+        self.collisionRadius = 0.
+        
+    checkCollision = Collidable.checkCollision
+    
+
 class MultiPartCollidable(Collidable):
     """
     These Collidables don't need a finer sself.parentBrane.parentUniverse.hape for collision detection.
     They have multiple circular parts inside their outer collision radius.
     If collision on outer radius is detected, verify it with inner parts.
     """
+    refinesCollision = True
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.part_rel_positions=np.array([[0,0]])
         self.part_radii=[self.collisionRadius]
         
+        # part positions and velocities, computed once per step when needed
+        self.partsValid = False
+        self.part_proxies = []
+        
+        
+    def update(self, dt: float):
+        super().update(dt)
+        self.partsValid = False
+        
+        
+    def updateParts(self, dt: float):
+        """
+        Compute world positions and velocities of the parts
+        and point the part proxies at them.
+        Only does work once per step.
+        """
+        if(self.partsValid):
+            return
+        
+        # find current positions of part centers
+        self.part_positions = self.r + np.matmul(self.part_rel_positions,
+                                                 rotMat(self.theta))
+        
+        # find old positions of part centers
+        rot_matrix = rotMat(self.theta - dt*self.rot_vel)
+        old_part_positions = self.r-self.v*dt +\
+                np.matmul(self.part_rel_positions, rot_matrix)
+                
+        # part velocities
+        self.part_velocities = (self.part_positions - old_part_positions)/dt
+        
+        self.part_radii_arr = np.asarray(self.part_radii, dtype=float)
+        if(len(self.part_proxies) != len(self.part_radii)):
+            self.part_proxies = [CollisionProxy() for p in self.part_radii]
+        for p, c in enumerate(self.part_proxies):
+            c.r = self.part_positions[p]
+            c.v = self.part_velocities[p]
+            c.collisionRadius = self.part_radii_arr[p]
+        self.partsValid = True
+        
     
     def checkCollision(self, other: "Collidable", dt):
         """
@@ -152,36 +206,27 @@ class MultiPartCollidable(Collidable):
         collided = super().checkCollision(other, dt)
         
         if(collided): # check collision with any of the parts
+            self.updateParts(dt)
             
-            # find current positions of part centers
-            rot_matrix = np.array([
-                    [np.cos(self.theta),   np.sin(self.theta)],
-                    [-np.sin(self.theta),  np.cos(self.theta)]])
-            part_positions = self.r + np.matmul(self.part_rel_positions,
-                                                rot_matrix)
-            
-            # find old positions of part centers
-            rot_matrix = rotMat(self.theta - dt*self.rot_vel)
-            old_part_positions = self.r-self.v*dt +\
-                    np.matmul(self.part_rel_positions, rot_matrix)
-                    
-            # part velocities
-            part_velocities = (part_positions - old_part_positions)/dt
-            
-            
-            # loop through the parts
-            for p in range(len(self.part_radii)):
-                # make temporary unregistered Collidables to represent each
-                c = Collidable()
-                c.r = part_positions[p,:]
-                c.v = part_velocities[p,:]
-                c.collisionRadius = self.part_radii[p]
-                
+            if(not other.refinesCollision):
+                # other's motion against all the stationary parts at once
+                uniSize = None
+                if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+                    uniSize = GlobalRules.curUniverseSize
+                nParts = self.part_positions.shape[0]
+                start = np.broadcast_to(other.r - other.dr, (nParts,2))
+                end = np.broadcast_to(other.r, (nParts,2))
+                hits = sweptCircleHits(start, end, self.part_positions,
+                                       other.collisionRadius + self.part_radii_arr,
+                                       uniSize)
+                collided = bool(np.any(hits))
+            else:
                 # Check for collision using other's function.
-                # If it is also multipart, this will allow part-part checks
-                collided = other.checkCollision(c, dt)
-                if(collided):
-                    break # exit the loop early if collision is verified
+                # This will allow part-part checks.
+                for c in self.part_proxies:
+                    collided = other.checkCollision(c, dt)
+                    if(collided):
+                        break # exit the loop early if collision is verified
     
         return(collided)
         
@@ -198,26 +243,17 @@ class MultiPartCollidable(Collidable):
             rot_matrix = np.array([
                     [np.cos(self.theta),   np.sin(self.theta)],
                     [-np.sin(self.theta),  np.cos(self.theta)]])    
-            screen_positions = self.r + np.matmul(self.part_rel_positions,
-                                                  rot_matrix)
+            rel_positions = np.matmul(self.part_rel_positions, rot_matrix)
             collision_color = (74, 184, 212) # light blue
             
-            if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
-                # if PBC, then draw colision circles for every image on screen
-                
-                # find visible periodic images and their coords
-                vis, pos = self.periodic_images # read cached values
-                for im in range(vis.shape[0]):
-                    if(vis[im]): # only draw if image on screen
-                        screen_image_pos = screen_positions - self.r + pos[im]
-                        for i in range(len(self.part_radii)):
-                            view.drawCircleToView(collision_color,
-                                                  screen_image_pos[i],
-                                                  self.part_radii[i], 2)
-            else:
-                # without PBC, just draw the collision circles in primary cell
-                for i in range(len(self.part_radii)):
-                    view.drawCircleToView(collision_color,
-                                          screen_positions[i],
-                                          self.part_radii[i], 2)
+            # draw colision circles for every image on screen,
+            # just the one in the primary cell without PBC
+            vis, pos = self.periodic_images # read cached values
+            for im in range(vis.shape[0]):
+                if(vis[im]): # only draw if image on screen
+                    screen_image_pos = rel_positions + pos[im]
+                    for i in range(len(self.part_radii)):
+                        view.drawCircleToView(collision_color,
+                                              screen_image_pos[i],
+                                              self.part_radii[i], 2)
                     
\ No newline at end of file
@@ -12,20 +12,40 @@ import pygame
 import BraneSpace.core.GlobalRules as GlobalRules
 from BraneSpace.core.Brane import Brane
 from BraneSpace.utils.AssetFactory import assetFactory
+from BraneSpace.utils.RotozoomCache import rotozoomCache
+from BraneSpace.utils.StoreField import StoreField
 
 class Entity():
     """
     An entity that can be simulated.
     It has position and velocity in world coordinates.
     Mixin, so can pass on constructor parameters to other superclasses.
+    Once registered, its physical state lives in the Universe's EntityStore.
     """
+    r = StoreField()
+    v = StoreField()
+    a = StoreField()
+    dr = StoreField()
+    mass = StoreField()
+    dragCoef = StoreField()
+    alive = StoreField()
+    _store = None # EntityStore holding the state, if registered
+    _slot = None
+    collides = False # checked for collisions by the Universe?
+    
     def __init__(self, mass=1.0, drag=0.0,
                  r = np.zeros(2), v = np.zeros(2), a = np.zeros(2),
                  *args, **kwargs):
         super().__init__(*args, **kwargs)  # forwards all unused arguments
         self.mass = mass
         self.dragCoef = drag
+        self.setupState(r, v, a)
         
+    def setupState(self, r, v, a):
+        """
+        Set motion and registration state to that of a new entity.
+        Shared by the constructor and reset().
+        """
         # coordinates in world space
         self.r = r
         self.v = v
@@ -39,7 +59,34 @@ class Entity():
         
         self.parentBrane = None
         
+        # Set to False when requesting destruction.
+        # The entity is then ignored until the Universe removes it.
+        self.alive = True
+        
+    def reset(self):
+        """
+        Bring a released entity back to the state of a new one,
+        so an ObjectPool can hand it out again.
+        Resets motion and registration, then calls startLife().
+        """
+        self.setupState(np.zeros(2), np.zeros(2), np.zeros(2))
+        self.startLife()
+        
+    def startLife(self):
+        """
+        Set up the state that changes over an entity's life.
+        Overwrite in pooled children and call from their constructors.
+        """
+        pass
+        
     def update(self, dt: float):
+        """
+        Velocity Verlet step.
+        Registered entities were already integrated by EntityStore.integrate,
+        so this only runs for entities outside the store.
+        """
+        if(self._store is not None):
+            return
 
         # force
         F = self.calcForce()
@@ -69,6 +116,9 @@ class Entity():
             self.r[self.r<0] += GlobalRules.curUniverseSize
         
     def calcForce(self):
+        if(self._store is not None):
+            # brane force was already computed for all entities at once
+            return(self._store.F[self._slot].copy())
         F = self.parentBrane.computeForceAt(self.r[np.newaxis,:])
         # remove the extra dimention used for multiple points
         F = np.squeeze(F, axis=0)
@@ -78,6 +128,7 @@ class Entity():
         """Add to the list of objects in the universe."""
         self.parentBrane = brane
         self.parentBrane.parentUniverse.updatables.append(self)
+        self.parentBrane.parentUniverse.entities.add(self)
         
         
         
@@ -85,6 +136,9 @@ class SpriteEntity(Entity, pygame.sprite.Sprite):
     """
     An entity that gets drawn on sceen.
     """
+    theta = StoreField()
+    rot_vel = StoreField()
+    
     def __init__(self, img_file=None, visible=True, size=16,
                  theta=0.0, rot_vel=0.0,
                  *args, **kwargs):
@@ -97,47 +151,64 @@ class SpriteEntity(Entity, pygame.sprite.Sprite):
         else:
             self.img = None
         
-        self.visible = visible
         self.size = size
+        self.setupPose(visible, theta, rot_vel)
         
+    def setupPose(self, visible, theta, rot_vel):
+        """
+        Set orientation and visibility to that of a new sprite.
+        Shared by the constructor and reset().
+        """
+        self.visible = visible
         self.theta = theta # direction in radians from North (Up)
         self.rot_vel = rot_vel # rotational velocity
+        self.periodic_images = None # where draw() last put the images
+        
+    def reset(self):
+        """
+        Also forget the orientation and spin of the last life,
+        before startLife() sets its own.
+        """
+        self.setupPose(True, 0.0, 0.0)
+        super().reset()
         
         
     def update(self, dt: float):
         super().update(dt)
-        #rotation
-        self.theta -= dt*self.rot_vel
+        #rotation, done by EntityStore.integrate if registered
+        if(self._store is None):
+            self.theta -= dt*self.rot_vel
         
                 
-    def draw(self, view):
+    def draw(self, view, images: tuple = None):
         """
         Draw to screen.
         Supports PBC.
+        images : visibility and world positions of the periodic images
+                 to draw at, like periodicImagesOnScreen() returns them.
+                 If None, the view finds them from the last cull or r.
         """
+        # find visible periodic images and their coords at the culled,
+        # interpolated positions, with or without PBC.
+        # Kept for debug shapes even when nothing is blitted.
+        if(images is None):
+            images = view.periodicImagesOnScreen(self)
+        self.periodic_images = images
+        vis, pos = images
+        
         # culling
-        if(view.isOnScreen(self)):
+        if(np.any(vis)):
              # check if image surface was created
             if(not self.img is None and self.visible):
-                # scale & rotate the image
+                # scale & rotate the image, reusing earlier results
                 zoom = float(self.size)*view.zoom/self.img.get_width()
-                surf = pygame.transform.rotozoom(
+                surf = rotozoomCache.rotozoom(
                         self.img,
                         -self.theta*180./np.pi, # in deg CCW of North (Up)
                         zoom)
-                
-                if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
-                    # find visible periodic images and their coords
-                    vis, pos = view.periodicImagesOnScreen(self)
-                    for i in range(vis.shape[0]):
-                        if(vis[i]): # check visibility of each image
-                            # draw that image to screen
-                            view.drawSurfToView(surf, pos[i])
-                    self.periodic_images = (vis,pos)
-                    
-                else:
-                    # draw single image to screen
-                    view.drawSurfToView(surf, self.r)
+                if(surf is not None): # None if less than a pixel wide
+                    # draw the visible images to screen
+                    view.drawSurfToView(surf, pos[vis])
         
 
     def register(self, brane: Brane):
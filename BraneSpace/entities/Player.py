@@ -9,6 +9,7 @@ Created on Fri May 10 15:07:40 2024
 import numpy as np
 from BraneSpace.entities.Collidable import MultiPartCollidable
 from BraneSpace.entities.Entity import SpriteEntity
+from BraneSpace.entities.resources.Resources import pickUpHits
 from BraneSpace.wavelets.Tractor import Tractor
 from BraneSpace.UI.View import WIDTH
 from BraneSpace.utils.AssetFactory import assetFactory
@@ -69,10 +70,10 @@ class Player(MultiPartCollidable):
                 ])
         
     def calcForce(self):
-        F = self.parentBrane.computeForceAt(self.r[np.newaxis,:])
-        # remove the extra dimention used for multiple points
-        F = np.squeeze(F, axis=0)
+        F = super().calcForce()
 
+        # facing unit vector
+        self.direction = np.array([np.sin(self.theta), -np.cos(self.theta)])
         if(self.fwd):
             F += self.direction * self.fwdThrust
         if(self.bck):
@@ -112,12 +113,13 @@ class Player(MultiPartCollidable):
                 # source of the wave in sim coords
                 # a bit forward of player ship
                 start = (self.r + 20*self.direction)
-                wl = Tractor(source=start, direction=self.direction,
-                             v = 12.8e-2,
-                             L = 32.0,
-                             A = A,
-                             Rmax = 180., # in world coords
-                             debug=False)
+                wl = Tractor.pool.acquire(source=start,
+                                          direction=self.direction,
+                                          v = 12.8e-2,
+                                          L = 32.0,
+                                          A = A,
+                                          Rmax = 180., # in world coords
+                                          debug=False)
                 wl.alive = self.tractorElapsed
                 wl.register(self.parentBrane)
                 
@@ -139,9 +141,11 @@ class Player(MultiPartCollidable):
         
         # only show engine flame if accelerating forward
         self.engine_flame.visible = self.fwd
-        # draw attachemnts
+        # draw attachemnts at the images of the ship, which were culled
+        # at the ship's drawn position, offset by where they are attached
+        vis, pos = view.periodicImagesOnScreen(self)
         for a in self.attachments:
-            a.draw(view)
+            a.draw(view, (vis, pos + (a.r - self.r)))
         
         # Debug shapes
         if(view.debug):            
@@ -150,12 +154,18 @@ class Player(MultiPartCollidable):
         
         
     def attemptPickUp(self, collectables: list, view: "View", dt: float):
-        """Call after update() of all entities."""
+        """
+        Call after update() of all entities.
+        Picks up all collectables the collector swept over in one batch.
+        """
         if(self.tractorActive):
             # compute collector velocity
             self.collector_v = self.v
-            for e in collectables:
-                e.attemptPickUp(self, view, dt)
+            picked = [collectables[k] for k in pickUpHits(collectables, self)]
+            for e in picked:
+                e.addToPlayer(self)
+                # removed from object lists at the end of the step
+                self.parentBrane.parentUniverse.requestDestroy(e)
         
         
     def collidedWith(self, other):
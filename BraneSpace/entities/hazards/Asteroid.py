@@ -11,6 +11,7 @@ from BraneSpace.entities.Collidable import Collidable
 from BraneSpace.entities.resources.Resources import DarkMatter
 from BraneSpace.utils.AssetFactory import assetFactory
 from BraneSpace.entities.hazards.Explosion import Explosion
+from BraneSpace.utils.ObjectPool import ObjectPool
 
 
 class Asteroid(Collidable):
@@ -19,19 +20,23 @@ class Asteroid(Collidable):
         
         # create/load image
         self.img = assetFactory.loadImg("entities/hazards/rock.png", True)
-        self.size = 32 # px
-        self.collisionRadius = 0.45*self.size
         
         # physics properties
         self.mass = 1.0e4
         self.dragCoef = 0.002
         
+        self.maxGrowTime = 2000.
+        self.startLife()
+        
+    def startLife(self):
+        self.size = 32 # px
+        self.collisionRadius = 0.45*self.size
+        
         self.rot_vel = np.random.uniform(-0.5, 0.5)*np.pi/1000 # +-90 deg/s
         self.theta = np.random.uniform(-1, 1)*np.pi
         
         # growing
         self.grow = False
-        self.maxGrowTime = 2000.
         self.curGrowTime = 0.
         
 
@@ -39,22 +44,22 @@ class Asteroid(Collidable):
         """Handle collisions.
         Asteroid gets destroyed and spawns some dark matter.
         """
+        universe = self.parentBrane.parentUniverse
         COM_v = (self.v*self.mass + other.v*other.mass)/(self.mass+other.mass)
         #for i in range(np.random.randint(1,3)):
         for i in range(1):
-            loot = DarkMatter()
+            loot = DarkMatter.pool.acquire()
             loot.r = self.r
             loot.v = COM_v + (np.random.random(2) - 0.5)*0.1
-            loot.register(self.parentBrane)
+            universe.requestSpawn(loot)
             
-        expl = Explosion()
+        expl = Explosion.pool.acquire()
         expl.r = self.r
         expl.v = self.v
-        expl.register(self.parentBrane)
+        universe.requestSpawn(expl)
             
-        # request destruction, delayed until end of update
-        self.alive = False # don't collision detect agains this anymore
-        self.parentBrane.parentUniverse.destroy_these_collidables.append(self)
+        # request destruction, delayed until end of the step
+        universe.requestDestroy(self)
 
     def update(self, dt: float):
         super().update(dt)
@@ -70,4 +75,7 @@ class Asteroid(Collidable):
                 factor = self.curGrowTime/self.maxGrowTime
                 self.size = 32*factor
                 self.collisionRadius = 0.45*self.size
-                
\ No newline at end of file
+                
+
+
+Asteroid.pool = ObjectPool(Asteroid)
@@ -11,8 +11,37 @@ import numpy.typing as npt
 
 import BraneSpace.core.GlobalRules as GlobalRules
 from BraneSpace.entities.Entity import SpriteEntity
-from BraneSpace.utils.AssetFactory import assetFactory
+from BraneSpace.utils.AssetFactory import assetFactory, alphaFrame
 from BraneSpace.utils.Geometry import expandPeriodicImages
+from BraneSpace.utils.Collisions import sweptCircleHits
+from BraneSpace.utils.ObjectPool import ObjectPool
+
+def pickUpHits(collectables: list, player: "Player") -> npt.ArrayLike:
+    """
+    Which collectables the player's collector picks up in this step.
+    Swept segments of all collectables, relative to the collector,
+    are tested against every periodic image of the collector in one call.
+    Returns indices into collectables.
+    """
+    n = len(collectables)
+    r = np.empty((n,2))
+    dr = np.empty((n,2))
+    alive = np.empty(n, dtype=bool)
+    for k, e in enumerate(collectables):
+        r[k] = e.r
+        dr[k] = e.dr
+        alive[k] = e.alive
+    uniSize = None
+    if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+        uniSize = GlobalRules.curUniverseSize
+    
+    # stationary collector by changing velocity of collectables
+    vdt = dr - player.dr
+    centers = np.broadcast_to(player.collector_r, (n,2))
+    radius = np.full(n, player.collect_radius)
+    hit = sweptCircleHits(r - vdt, r, centers, radius, uniSize)
+    return(np.flatnonzero(hit & alive))
+
 
 class Collectable(SpriteEntity):
     """
@@ -34,9 +63,13 @@ class Collectable(SpriteEntity):
         pass
         
     def attemptPickUp(self, player: "Player", view: "View", dt: float):
+        """
+        Reference pickup test of a single collectable.
+        Player.attemptPickUp tests all of them at once with pickUpHits().
+        """
         # culling, can't pick up things far away anyway
         sucess = False
-        if(view.isOnScreen(self)):
+        if(self.alive and view.isOnScreen(self)):
             
             # line segment to circle collision
             # stationary circle by changing velocity of Collectable
@@ -79,21 +112,17 @@ class Collectable(SpriteEntity):
                 # give to the player
                 self.addToPlayer(player)
                 
-                # remove instance from object lists
-                self.parentBrane.parentUniverse.collectables.remove(self)
-                self.parentBrane.parentUniverse.updatables.remove(self)
-                self.parentBrane.parentUniverse.drawables.remove(self)
-                # this instance can now be garbage collected
+                # remove instance from object lists at the end of the step
+                self.parentBrane.parentUniverse.requestDestroy(self)
 
 
 class DarkMatter(Collectable):
     def __init__(self):
         super().__init__()
         
-        # create/load image
-        self.img = assetFactory.loadImg("entities/resources/dark_matter.png", True)
-        # needs to be a local copy to allow per-resource alpha
-        self.img = self.img.copy() 
+        # create/load image and its shared faded variants
+        self.baseImg = assetFactory.loadImg("entities/resources/dark_matter.png", True)
+        self.frames = self.loadFrames()
         self.size = 16 # px
         
         # physics properties
@@ -101,14 +130,28 @@ class DarkMatter(Collectable):
         self.dragCoef = 0.05
         
         # decay properties
-        self.maxLifeTime = 10000 + np.random.random()*5000. # ms; 10-15 s
-        self.curLifeTime = 0   # ms
-        
         self.blink_factor_start = 0.8 # when blinking starts
         self.blink_times = 5          # how many blinks
         self.half_blink_period = (1.-self.blink_factor_start)/(self.blink_times*2-1)
         self.invis_blink_increase_start = self.blink_factor_start - self.half_blink_period 
         
+        self.startLife()
+        
+    @staticmethod
+    def loadFrames() -> list:
+        """
+        Shared blink frames, at the size dark matter is drawn.
+        Call on startup, so the first drop doesn't wait for them.
+        """
+        return(assetFactory.loadAlphaFrames("entities/resources/dark_matter.png",
+                                            16))
+        
+    def startLife(self):
+        self.maxLifeTime = 10000 + np.random.random()*5000. # ms; 10-15 s
+        self.curLifeTime = 0   # ms
+        
+        self.img = self.baseImg
+        
         
     def update(self, dt: float):
         super().update(dt)
@@ -116,11 +159,7 @@ class DarkMatter(Collectable):
         # lifetime
         self.curLifeTime += dt
         if(self.curLifeTime > self.maxLifeTime):
-            # safe to destroy here: we are outside universe.collisionDetect()
-            # remove instance from object lists
-            self.parentBrane.parentUniverse.collectables.remove(self)
-            self.parentBrane.parentUniverse.updatables.remove(self)
-            self.parentBrane.parentUniverse.drawables.remove(self)
+            self.parentBrane.parentUniverse.requestDestroy(self)
             return
         
         # check if we should be blinking
@@ -133,17 +172,10 @@ class DarkMatter(Collectable):
             
             # calculate new alpha value by modulus
             alpha = np.fmod(b * self.blink_times, 1.) # progress of a blink: 0 to 1
-            alpha = int((1 - np.abs(alpha*2 - 1))*256) # alpha: 256 -> opaque
-            if(alpha<1):
-                # clamp alpha so mask below always works, even after image
-                # should have gone completely transparent
-                alpha = 1
+            alpha = (1 - np.abs(alpha*2 - 1))*255 # alpha: 255 -> opaque
 #            print(f"factor={factor:.2f}, b={b:.2f}, alpha={alpha}")
         
-            # overwrite img's alpha
-            img_a = np.array(self.img.get_view('A'), copy=False)
-            img_a[img_a>0] = alpha
-            del img_a # to unlock img and allow blit
+            self.img = alphaFrame(self.frames, alpha)
 
         
     def addToPlayer(self, player: "Player"):
@@ -152,3 +184,6 @@ class DarkMatter(Collectable):
         """
         # for now just put into the score
         player.score += 1
+
+
+DarkMatter.pool = ObjectPool(DarkMatter)
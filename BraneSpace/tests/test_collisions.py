@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from BraneSpace.UI.View import View
+from BraneSpace.core.Universe import Universe
+from BraneSpace.entities.hazards.Asteroid import Asteroid
+from BraneSpace.entities.Player import Player
+from BraneSpace.entities.Collidable import Collidable
+from BraneSpace.entities.resources.Resources import DarkMatter, pickUpHits
+from BraneSpace.utils.Geometry import rotMat
+from BraneSpace.utils.Collisions import broadphasePairs, sweptCircleHits
+
+
+def makeCrowdedUniverse(N, seed):
+    """
+    Universe with N moving asteroids, many of them overlapping.
+    """
+    np.random.seed(seed)
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    player = Player(r = np.zeros(2), v = np.zeros(2))
+    player.dr = np.array([3., -4.])
+    player.register(universe.brane)
+    for i in range(N):
+        roid = Asteroid()
+        roid.r = np.random.random(2)*600
+        roid.dr = (np.random.random(2) - 0.5)*20
+        roid.register(universe.brane)
+    return(universe)
+
+
+def test_BroadphaseFindsAllCollisions():
+    universe = makeCrowdedUniverse(200, 0)
+    cs = universe.collidables
+
+    r = np.array([c.r for c in cs])
+    swept = np.array([c.collisionRadius + np.linalg.norm(c.dr) for c in cs])
+    ci, cj = broadphasePairs(r, swept, 600)
+    candidates = set(zip(ci.tolist(), cj.tolist()))
+
+    collisions = 0
+    for i in range(len(cs)-1):
+        for j in range(i+1, len(cs)):
+            if(cs[i].checkCollision(cs[j], 16.)):
+                collisions += 1
+                assert((i,j) in candidates)
+    assert(collisions > 0)
+    assert(len(candidates) < len(cs)*(len(cs)-1)//2)
+
+
+def test_SweptCircleHitsMatchesCheckCollision():
+    universe = makeCrowdedUniverse(200, 3)
+    cs = [c for c in universe.collidables if not c.refinesCollision]
+
+    i, j = np.triu_indices(len(cs), k=1)
+    r = np.array([c.r for c in cs])
+    dr = np.array([c.dr for c in cs])
+    radius = np.array([c.collisionRadius for c in cs])
+    vdt = dr[i] - dr[j]
+    hit = sweptCircleHits(r[i] - vdt, r[i], r[j], radius[i] + radius[j], 600)
+
+    ref = np.array([cs[a].checkCollision(cs[b], 16.) for a,b in zip(i,j)])
+    assert(np.any(ref))
+    assert(np.array_equal(hit, ref))
+
+
+def referencePartCheck(multi, other, dt):
+    """
+    Part checks of a MultiPartCollidable done with temporary Collidables.
+    """
+    if(not Collidable.checkCollision(multi, other, dt)):
+        return(False)
+    part_positions = multi.r + np.matmul(multi.part_rel_positions,
+                                         rotMat(multi.theta))
+    for p in range(len(multi.part_radii)):
+        c = Collidable()
+        c.r = part_positions[p,:]
+        c.collisionRadius = multi.part_radii[p]
+        if(other.checkCollision(c, dt)):
+            return(True)
+    return(False)
+
+
+def test_MultiPartChecksMatchTemporaryCollidables():
+    universe = makeCrowdedUniverse(200, 4)
+    player = universe.collidables[0]
+    player.theta = 0.7
+
+    outer_hits = 0
+    for roid in universe.collidables[1:]:
+        # move the asteroid close to the player's hull
+        roid.r = player.r + (np.random.random(2) - 0.5)*80
+        outer_hits += Collidable.checkCollision(player, roid, 16.)
+        assert(player.checkCollision(roid, 16.) ==
+               referencePartCheck(player, roid, 16.))
+    assert(outer_hits > 0)
+
+
+def test_CollisionDetectMatchesAllPairs():
+    survivors = []
+    for detect in ["collisionDetect", "collisionDetectAllPairs"]:
+        universe = makeCrowdedUniverse(200, 1)
+        np.random.seed(2) # same loot and explosions
+        getattr(universe, detect)(16.)
+        universe.commit()
+        survivors.append(sorted((type(c).__name__, tuple(c.r))
+                                for c in universe.collidables))
+
+    assert(sum(1 for s in survivors[0] if s[0] == "Asteroid") < 200)
+    assert(survivors[0] == survivors[1])
+
+
+def test_PickUpHitsMatchesPerCollectableChecks():
+    universe = makeCrowdedUniverse(0, 6)
+    player = universe.collidables[0]
+    view = universe.view
+    # collector near a corner, so pickups happen across the boundaries
+    player.collector_r = np.array([5., 590.])
+    view.center = player.collector_r.copy()
+    assert (pickUpHits([], player).size == 0)
+    
+    for i in range(300):
+        dm = DarkMatter()
+        dm.r = np.mod(player.collector_r + (np.random.random(2)-0.5)*60, 600)
+        dm.dr = (np.random.random(2) - 0.5)*30
+        dm.register(universe.brane)
+    cs = universe.collectables[:]
+    cs[0].alive = False # already destroyed ones are skipped
+    
+    picked = pickUpHits(cs, player)
+    
+    # reference: one collectable at a time
+    for e in cs[1:]:
+        e.attemptPickUp(player, view, 16.)
+    ref = [k for k in range(1, len(cs)) if not cs[k].alive]
+    assert (len(ref) > 0)
+    assert (picked.tolist() == ref)
+    assert (player.score == len(ref))
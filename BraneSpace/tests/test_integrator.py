@@ -6,5 +6,125 @@ Created on Fri May 10 12:35:41 2024
 @author: zetadin
 """
 
+import numpy as np
+from BraneSpace.UI.View import View
+from BraneSpace.core.Universe import Universe
+from BraneSpace.core.FixedTimestep import FixedTimestep
+from BraneSpace.entities.hazards.Asteroid import Asteroid
+from BraneSpace.entities.Player import Player
+from BraneSpace.wavelets.Tractor import Tractor
+
+
 def test_pytest():
-    assert True
\ No newline at end of file
+    assert True
+
+
+def test_EntityStoreMatchesPerEntityUpdate():
+    np.random.seed(5)
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    brane = universe.brane
+
+    # pushy wavelets so forces are non-zero
+    for i in range(20):
+        wl = Tractor(source=np.random.random(2)*600,
+                     direction=np.random.random(2)-0.5,
+                     v = 12.8e-2, L = 32.0, A = 0.1, Rmax = 180.)
+        wl.register(brane)
+
+    # registered entities and unregistered twins updated one at a time
+    stored = [Player(r = np.zeros(2), v = np.zeros(2))]
+    stored[0].fwd = True
+    stored[0].rotationDirection = 1.0
+    for i in range(50):
+        stored.append(Asteroid())
+        stored[-1].r = np.random.random(2)*600
+        stored[-1].v = (np.random.random(2) - 0.5)*0.3
+    twins = [Player(r = np.zeros(2), v = np.zeros(2))]
+    twins[0].fwd = True
+    twins[0].rotationDirection = 1.0
+    twins += [Asteroid() for i in range(50)]
+    for s, t in zip(stored, twins):
+        t.r = s.r.copy()
+        t.v = s.v.copy()
+        t.theta = s.theta
+        t.rot_vel = s.rot_vel
+        t.parentBrane = brane
+        s.register(brane)
+
+    for step in range(50):
+        universe.update(16.)
+        for t in twins:
+            t.update(16.)
+
+    assert(len(universe.entities) == len(stored))
+    for s, t in zip(stored, twins):
+        assert(s._store is universe.entities)
+        assert(np.allclose(s.r, t.r))
+        assert(np.allclose(s.v, t.v))
+        assert(np.allclose(s.dr, t.dr))
+        assert(np.isclose(s.theta, t.theta))
+    assert(np.any(universe.entities.F[:len(stored)] != 0))
+
+
+def test_FixedTimestepSchedulesWholeSteps():
+    sched = FixedTimestep(10., maxSteps=3)
+    frames = [4., 4., 4., 25., 0., 7.]
+    steps = [sched.advance(t) for t in frames]
+    assert (steps == [0, 0, 1, 2, 0, 1])
+    assert (np.isclose(sched.alpha, 0.4))
+    assert (sched.dropped == 0.)
+    
+    # a long stall only catches up maxSteps, keeping the fraction of a step
+    assert (sched.advance(1000.) == 3)
+    assert (np.isclose(sched.alpha, 0.4))
+    assert (np.isclose(sched.dropped, 970.))
+    sched.reset()
+    assert (sched.alpha == 0.)
+    
+    # all frame time is simulated, carried over or dropped
+    frames = np.random.default_rng(1).uniform(5., 30., 200)
+    steps = [sched.advance(t) for t in frames]
+    assert (max(steps) == 3)
+    assert (np.isclose(sum(steps)*sched.dt + sched.accumulator + sched.dropped,
+                       np.sum(frames) + 970.))
+
+
+def test_InterpolatedPositionsTrailByStep():
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    roid = Asteroid()
+    roid.r = np.array([100., 200.])
+    roid.v = np.array([0.1, -0.05])
+    roid.register(universe.brane)
+    store = universe.entities
+    
+    start = roid.r.copy()
+    universe.update(16.)
+    assert (np.allclose(store.interpolatedPositions(0.)[0], start))
+    assert (np.allclose(store.interpolatedPositions(1.)[0], roid.r))
+    assert (np.allclose(store.interpolatedPositions(0.25)[0],
+                        start + 0.25*(roid.r - start)))
+
+
+def test_StoreFieldVectorsAreCopies():
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    roids = []
+    for i in range(3):
+        roids.append(Asteroid())
+        roids[-1].r = np.array([10.*i, 20.])
+        roids[-1].register(universe.brane)
+    
+    r = roids[0].r
+    r[0] = -1. # edits a copy, not the store
+    assert (roids[0].r[0] == 0.)
+    roids[0].r += np.array([1., 1.]) # augmented assignment writes back
+    assert (np.all(roids[0].r == [1., 21.]))
+    
+    # a row that moved on swap-remove doesn't change what was read before
+    r = roids[0].r
+    universe.entities.remove(roids[0])
+    roids[2].r = np.array([5., 5.])
+    assert (np.all(r == [1., 21.]))
+    assert (np.all(roids[2].r == [5., 5.]))
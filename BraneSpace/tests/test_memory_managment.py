@@ -9,7 +9,11 @@ Created on Mon Jul 22 11:22:18 2024
 import numpy as np
 from BraneSpace.UI.View import View
 from BraneSpace.core.Universe import Universe
+from BraneSpace.core.Registry import Registry
 from BraneSpace.entities.hazards.Asteroid import Asteroid
+from BraneSpace.entities.hazards.Explosion import Explosion
+from BraneSpace.entities.resources.Resources import DarkMatter
+from BraneSpace.wavelets.Tractor import Tractor
 from time import time
 
 
@@ -75,4 +79,235 @@ def test_FastDestroyRequested():
     assert (len(universe.collidables) == N_should_remain)
     assert (len(universe.updatables) == N_should_remain+1) # Asteroids +1 Brane
     assert (len(universe.drawables) == N_should_remain+1)  # Asteroids +1 Brane
-    
\ No newline at end of file
+        
+    
+class CountingDict(dict):
+    """
+    dict that counts item assignments, to measure bookkeeping work.
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.writes = 0
+        
+    def __setitem__(self, key, value):
+        self.writes += 1
+        super().__setitem__(key, value)
+        
+        
+def fastDestroyWrites(N, N_destroy, repeats=5):
+    """
+    Most index updates in the unordered registries that
+    fastDestroyRequested needs to remove N_destroy of N asteroids.
+    """
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    registries = [universe.collidables, universe.updatables]
+    most = 0
+    for rep in range(repeats):
+        # top up the asteroids
+        while(len(universe.collidables) < N):
+            roid = Asteroid()
+            roid.r = np.random.random(2)*1000
+            roid.v = (np.random.random(2) - 0.5)*0.03
+            roid.register(universe.brane)
+        
+        index = np.random.choice(np.arange(N), N_destroy, replace=False)
+        universe.destroy_these_collidables=[universe.collidables[i] for i in index]
+        
+        for reg in registries:
+            reg.index = CountingDict(reg.index)
+        universe.fastDestroyRequested()
+        most = max(most, sum(reg.index.writes for reg in registries))
+        
+        assert (len(universe.collidables) == N - N_destroy)
+        assert (len(universe.updatables) == N - N_destroy + 1)
+        assert (len(universe.drawables) == N - N_destroy + 1)
+        assert (len(universe.entities) == N - N_destroy)
+        # brane stays first so it is drawn under everything else
+        assert (universe.drawables[0] is universe.brane)
+    return(most)
+
+
+def test_FastDestroyScalesWithDestroyed():
+    N_destroy = 30
+    # 20x more asteroids, but the same number to destroy:
+    # at most one moved object per removal in each registry
+    for N in (200, 4000):
+        assert (fastDestroyWrites(N, N_destroy) <= 2*N_destroy)
+    
+    
+def test_RegistryIndexStaysConsistent():
+    for ordered in (False, True):
+        registry = Registry(ordered)
+        objs = [object() for i in range(100)]
+        for o in objs:
+            registry.append(o)
+        registry.append(objs[0]) # registering twice is a no-op
+        assert (len(registry) == 100)
+        
+        removed = np.random.choice(np.arange(100), 60, replace=False)
+        for i in removed[:30]:
+            registry.remove(objs[i])
+        registry.removeMany([objs[i] for i in removed[30:]] + [objs[removed[0]]])
+        kept = set(range(100)) - set(removed.tolist())
+        
+        assert (len(registry) == len(kept))
+        assert (set(registry) == {objs[i] for i in kept})
+        if(ordered):
+            assert (list(registry) == [objs[i] for i in sorted(kept)])
+        for pos, o in enumerate(registry):
+            assert (registry.index[o] == pos)
+        for i in removed:
+            assert (objs[i] not in registry)
+            registry.discard(objs[i]) # no-op
+    
+    
+def test_CommitAppliesQueuedSpawnsAndDestroys():
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    roids = []
+    for i in range(2):
+        roid = Asteroid()
+        roid.r = np.array([100., 100.])
+        roid.register(universe.brane)
+        roids.append(roid)
+    
+    roids[0].collidedWith(roids[1])
+    roids[1].collidedWith(roids[0])
+    
+    # nothing changes until the commit
+    assert (not roids[0].alive and not roids[1].alive)
+    assert (len(universe.collidables) == 2)
+    assert (len(universe.updatables) == 3)
+    assert (len(universe.collectables) == 0)
+    
+    universe.commit()
+    
+    # each asteroid is replaced by an explosion and a dark matter
+    assert (len(universe.collidables) == 2)
+    assert (all(type(c).__name__ == "Explosion" for c in universe.collidables))
+    assert (len(universe.collectables) == 2)
+    assert (len(universe.updatables) == 5)
+    assert (len(universe.entities) == 4)
+    for e in universe.updatables:
+        if(e is not universe.brane):
+            assert (np.allclose(e.r, [100., 100.]))
+    
+    # expired explosions leave on the next commit
+    universe.update(2000.)
+    assert (len(universe.collidables) == 2)
+    universe.commit()
+    assert (len(universe.collidables) == 0)
+    
+    
+def test_DestroyKeepsDrawingOrder():
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    roids = []
+    for i in range(6):
+        roid = Asteroid()
+        roid.register(universe.brane)
+        roids.append(roid)
+    
+    universe.requestDestroy(roids[0])
+    universe.requestDestroy(roids[3])
+    universe.commit()
+    assert (list(universe.drawables) ==
+            [universe.brane] + [roids[i] for i in (1, 2, 4, 5)])
+    
+    
+def test_PoolsRecycleDestroyedEntities():
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    Asteroid.pool.free.clear()
+    
+    # steady state: every step one asteroid collides and one is spawned
+    roids = []
+    for i in range(2):
+        roid = Asteroid.pool.acquire()
+        roid.register(universe.brane)
+        roids.append(roid)
+    for step in range(20):
+        old = roids.pop(0)
+        old.collidedWith(roids[0])
+        universe.update(16.)
+        universe.commit()
+        
+        misses = Asteroid.pool.misses
+        roid = Asteroid.pool.acquire()
+        if(step > 0):
+            # the asteroid destroyed in this step is reused
+            assert (Asteroid.pool.misses == misses)
+            assert (roid is old)
+        roid.register(universe.brane)
+        roids.append(roid)
+        
+        # reused instances start like new ones
+        assert (roid.alive)
+        assert (roid.parentBrane is universe.brane)
+        assert (np.all(roid.v == 0.))
+        assert (roid.size == 32 and not roid.grow)
+        
+    assert (Asteroid.pool.hits >= 19)
+    
+    # explosions are recycled too, with their faded alpha restored
+    universe.update(500.)
+    universe.update(600.)
+    universe.commit()
+    assert (len(Explosion.pool.free) > 0)
+    hits = Explosion.pool.hits
+    expl = Explosion.pool.acquire()
+    assert (Explosion.pool.hits == hits+1)
+    assert (expl.curLifeTime == 0)
+    assert (expl.img is expl.baseImg)
+    
+    
+def test_ResetRestoresEveryField():
+    # a pooled sprite without its own spin forgets the last one
+    loot = DarkMatter.pool.acquire()
+    loot.theta = 1.0
+    loot.rot_vel = 0.5
+    loot.visible = False
+    loot.r = np.array([10., 20.])
+    loot.periodic_images = (np.ones(1, dtype=bool), np.array([[10., 20.]]))
+    loot.reset()
+    assert (loot.theta == 0. and loot.rot_vel == 0.)
+    assert (loot.periodic_images is None)
+    assert (loot.visible)
+    assert (np.all(loot.r == 0.) and np.all(loot.dr == 0.))
+    
+    # a reused Tractor matches a new one built from the same arguments
+    args = (np.array([5., 6.]), np.array([0., 2.]))
+    old = Tractor(np.array([1., 2.]), np.array([1., 0.]), L=8, A=0.3)
+    old.lifetime = 50.
+    old.alive = 20.
+    old.reset(*args)
+    new = Tractor(*args)
+    assert (old.__dict__.keys() == new.__dict__.keys())
+    for k, v in new.__dict__.items():
+        assert (np.all(old.__dict__[k] == v)), k
+    
+    
+def test_FadingSpritesShareAlphaFrames():
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    expls = []
+    for i in range(3):
+        expl = Explosion.pool.acquire()
+        expl.register(universe.brane)
+        expls.append(expl)
+    universe.update(500.)
+    
+    # same fade stage, same shared surface, no per-instance copies
+    assert (expls[0].img is expls[1].img is expls[2].img)
+    assert (expls[0].img is not expls[0].baseImg)
+    img_a = np.array(expls[0].img.get_view('A'), copy=False)
+    visible = img_a > 0
+    assert (np.any(visible) and not np.all(visible))
+    assert (np.all(np.abs(img_a[visible].astype(int) - 90) <= 255/30))
+    del img_a
+    
+    # frames are few and no larger than explosions are drawn
+    frames = expls[0].frames
+    assert (len(frames) <= 16)
+    assert (all(f.get_width() <= expls[0].maxSize for f in frames))
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pygame
+import BraneSpace.core.GlobalRules as GlobalRules
+from BraneSpace.UI.View import View
+from BraneSpace.core.Universe import Universe
+from BraneSpace.entities.Entity import SpriteEntity
+from BraneSpace.entities.hazards.Asteroid import Asteroid
+from BraneSpace.utils.Geometry import shift_arr
+from BraneSpace.utils.AssetFactory import assetFactory
+from BraneSpace.utils.RotozoomCache import RotozoomCache
+from BraneSpace.utils.Colormaps import colormaps
+from BraneSpace.tests.test_wavelets import makeTractors
+
+
+def test_RotozoomCacheQuantizesAndEvicts():
+    view = View() # sets up the display needed to load images
+    img = assetFactory.loadImg("entities/hazards/rock.png", True)
+    cache = RotozoomCache(angleStep=2.0, maxBytes=20*1024)
+    
+    # a slowly rotating sprite hits the cache between angle bins
+    first = cache.rotozoom(img, 10.2, 32/512)
+    assert (cache.rotozoom(img, 9.5, 32/512) is first)
+    assert (cache.rotozoom(img, 370.4, 32/512) is first) # full turn
+    assert (cache.hits == 2 and cache.misses == 1)
+    ref = pygame.transform.rotozoom(img, 10., 32/512)
+    assert (first.get_size() == ref.get_size())
+    
+    # growing sprite: zoom is quantized to whole pixels of output width
+    assert (cache.rotozoom(img, 10., 0.4/512) is None)
+    sizes = [cache.rotozoom(img, 10., w/512).get_width() for w in range(1,33)]
+    assert (sizes == sorted(sizes))
+    
+    # memory stays under the cap, least recently used entries go first
+    assert (cache.bytes <= cache.maxBytes)
+    assert ((img, 5, 1) not in cache.entries)
+    assert ((img, 5, 32) in cache.entries)
+    assert (0. < cache.hitRate() < 1.)
+
+
+def test_DrawQueueFlushesLayersInOrder():
+    view = View()
+    view.displaysurface.fill((0,0,0))
+    red = pygame.Surface((8,8))
+    red.fill((255,0,0))
+    blue = pygame.Surface((16,16))
+    blue.fill((0,0,255))
+    
+    # sprite queued before the background still ends up on top of it
+    r = view.center + np.array([[0.,0.], [40.,0.]])
+    view.drawSurfToView(red, r) # two images at once
+    view.drawSurfToView(blue, view.center, view.LAYER_BRANE)
+    view.drawCircleToView((0,255,0), view.center + np.array([0.,30.]), 3, 0)
+    view.drawCircleToView((0,255,0), r[1] + np.array([0.,2.]), 3, 0,
+                          view.LAYER_BRANE) # under the second red image
+    x, y = view.transform(view.center).astype(int)
+    
+    # nothing reaches the screen before the flush
+    assert (tuple(view.displaysurface.get_at((x,y)))[:3] == (0,0,0))
+    view.flush()
+    assert (tuple(view.displaysurface.get_at((x,y)))[:3] == (255,0,0))
+    assert (tuple(view.displaysurface.get_at((x+6,y)))[:3] == (0,0,255))
+    assert (tuple(view.displaysurface.get_at((x+40,y)))[:3] == (255,0,0))
+    assert (tuple(view.displaysurface.get_at((x,y+30)))[:3] == (0,255,0))
+    assert (tuple(view.displaysurface.get_at((x+40,y+2)))[:3] == (255,0,0))
+    assert (tuple(view.displaysurface.get_at((x+40,y+4)))[:3] == (0,255,0))
+    assert (not any(view.drawQueue))
+
+
+def test_CullMatchesPerEntityVisibility():
+    GlobalRules.pbc = GlobalRules.PBC.TOROIDAL
+    GlobalRules.curUniverseSize = 600
+    view = View()
+    view.zoom = 1.5
+    view.center = np.array([550., 20.])
+    
+    rng = np.random.default_rng(5)
+    ents = []
+    for i in range(300):
+        e = SpriteEntity(size=rng.random()*64)
+        e.r = rng.random(2)*600
+        ents.append(e)
+    
+    # reference: per-entity checks, before any cull
+    ref_vis = [view.periodicImagesOnScreen(e)[0] for e in ents]
+    ref_on = [bool(np.any(v)) for v in ref_vis]
+    assert (0 < sum(ref_on) < len(ents))
+    
+    vis, pos = view.cull(ents)
+    assert (np.array_equal(vis, np.array(ref_vis)))
+    for k, e in enumerate(ents):
+        v, p = view.periodicImagesOnScreen(e)
+        assert (v is not None and np.array_equal(v, vis[k]))
+        assert (np.allclose(p, e.r + shift_arr*600))
+        assert (view.isOnScreen(e) == ref_on[k])
+
+
+def makeBraneWithTractors(N):
+    """
+    Universe whose brane has N random Tractors around the view.
+    """
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    for wl in makeTractors(N, 600):
+        wl.register(universe.brane)
+    return(universe.brane)
+
+
+def test_DebugDrawOfSubpixelCollidable():
+    GlobalRules.pbc = GlobalRules.PBC.TOROIDAL
+    GlobalRules.curUniverseSize = 600
+    view = View()
+    universe = Universe(view, parallel=False, braneSurfScale=4.0)
+    view.debug = True
+    
+    # a freshly spawned growing asteroid has no size yet
+    roid = Asteroid()
+    roid.r = view.center.copy()
+    roid.size = 0.
+    roid.grow = True
+    roid.register(universe.brane)
+    roid.draw(view)
+    vis, pos = roid.periodic_images
+    assert (np.any(vis))
+    assert (len(view.drawQueue[view.LAYER_SPRITES]) == 0)
+    assert (len(view.drawQueue[view.LAYER_DEBUG]) == np.count_nonzero(vis))
+    view.flush()
+
+
+def test_SpritesDrawAtInterpolatedPositions():
+    for pbc in (GlobalRules.PBC.NONE, GlobalRules.PBC.TOROIDAL):
+        view = View()
+        universe = Universe(view, parallel=False, braneSurfScale=4.0)
+        GlobalRules.pbc = pbc # after the Universe picked its own
+        GlobalRules.curUniverseSize = 600
+        roid = Asteroid()
+        roid.r = view.center + np.array([20., 0.])
+        roid.dr = np.array([8., 4.])
+        roid.register(universe.brane)
+        
+        # halfway between the last two steps
+        store = universe.entities
+        view.cull(store.owners, store.interpolatedPositions(0.5))
+        roid.draw(view)
+        queue = view.drawQueue[view.LAYER_SPRITES]
+        assert (len(queue) == 1)
+        surf, rect = queue[0]
+        drawn = view.transform(roid.r - 0.5*roid.dr)
+        assert (np.all(np.abs(np.array(rect.center) - drawn) <= 1))
+        view.flush()
+
+
+def test_PaletteColorizationMatchesGreyscale():
+    brane = makeBraneWithTractors(20)
+    brane.draw(brane.view)
+    surf = brane.rgbSurf
+    
+    # reference: the original per-frame greyscale conversion
+    ref = np.floor(np.clip(256*(brane.I*4.0+1)/2, 0,255)).astype(int)
+    rgb = pygame.surfarray.array3d(surf).astype(int)
+    assert (np.any(ref != 128))
+    for c in range(3):
+        assert (np.max(np.abs(rgb[:,:,c] - ref)) <= 1)
+    
+    # same surfaces are reused by later frames and other colormaps
+    brane.setColormap("coolwarm")
+    brane.update(16.)
+    brane.draw(brane.view)
+    assert (brane.rgbSurf is surf)
+    rgb = pygame.surfarray.array3d(surf)
+    flat = (np.abs(brane.I) < 1e-12)
+    assert (np.all(rgb[flat] == colormaps["coolwarm"][128]))
+
+
+def test_BraneScaleFiltersReuseTarget():
+    brane = makeBraneWithTractors(20)
+    brane.draw(brane.view)
+    src = brane.rgbSurf
+    w, h = src.get_size()
+    size = (int(w*brane.surfScale), int(h*brane.surfScale))
+    
+    targets = set()
+    for name, ref in [
+            ("smooth", pygame.transform.smoothscale(src, size)),
+            ("nearest", pygame.transform.scale(src, size)),
+            ("scale2x", pygame.transform.scale2x(
+                                    pygame.transform.scale2x(src)))]:
+        brane.setScaleFilter(name)
+        for frame in range(2):
+            surf = brane.scaleToScreen(src)
+            targets.add(id(surf))
+        assert (surf.get_size() == size)
+        assert (np.array_equal(pygame.surfarray.array3d(surf),
+                               pygame.surfarray.array3d(ref)))
+    assert (len(targets) == 1)
+    
+    brane.cycleScaleFilter()
+    assert (brane.scaleFilter == "smooth")
+
+
+def test_GradientOverlayMatchesPerFrameSurface():
+    brane = makeBraneWithTractors(20)
+    brane.drawGradients = True
+    brane.draw(brane.view)
+    
+    # reference: the original per-frame overlay on the plain intensity
+    ref_surf = pygame.Surface(brane.rgbSurf.get_size(), depth=32)
+    ref_surf.blit(brane.ampSurf, (0,0))
+    grad_arr = -brane.G
+    grad_colors = np.zeros((brane.simShape[0],brane.simShape[1],3)).astype(np.uint8)
+    grad_colors[:,:,0] = np.floor(np.clip(256*(grad_arr[:,:,0]+1)/2, 0,255)).astype(np.uint8)
+    grad_colors[:,:,1] = np.floor(np.clip(256*(grad_arr[:,:,1]+1)/2, 0,255)).astype(np.uint8)
+    grad_alpha = np.floor(np.clip(np.max(np.abs(grad_arr), axis=-1), 0.0, 0.1)*2550).astype(np.uint8)
+    grad_surf = pygame.Surface((brane.simShape[0],brane.simShape[1]), pygame.SRCALPHA, 32)
+    pygame.pixelcopy.array_to_surface(grad_surf, grad_colors)
+    gsa = np.array(grad_surf.get_view('A'), copy=False)
+    gsa[:,:] = grad_alpha
+    del gsa
+    ref_surf.blit(grad_surf, grad_surf.get_rect())
+    
+    assert (np.any(grad_alpha > 0))
+    diff = (pygame.surfarray.array3d(brane.rgbSurf).astype(int) -
+            pygame.surfarray.array3d(ref_surf).astype(int))
+    assert (np.max(np.abs(diff)) <= 1)
+    
+    # coarser gradient samples the same field on every other grid point
+    G_full = brane.G
+    overlay = brane.gradSurf
+    brane.gradStride = 2
+    brane.draw(brane.view)
+    assert (np.allclose(brane.G, G_full[::2, ::2]))
+    assert (brane.gradSurf.get_size() == brane.G.shape[:2])
+    brane.draw(brane.view) # cached fields, same surfaces
+    brane.gradStride = 1
+    brane.update(16.)
+    brane.draw(brane.view)
+    assert (brane.gradSurf.get_size() == overlay.get_size())
+
+
+def test_FieldsRefreshOnWaveletChanges():
+    brane = makeBraneWithTractors(20)
+    brane.refreshFields()
+    I = brane.I
+    
+    # same time and view, but a Tractor parameter was written
+    wl = brane.tractors.owners[0]
+    wl.A = 2*wl.A
+    brane.refreshFields()
+    assert (brane.I is not I)
+    I = brane.I
+    brane.refreshFields()
+    assert (brane.I is I)
+    
+    # one plain wavelet swapped for another keeps the count
+    old, new = makeTractors(2, 600)
+    brane.wavelets.append(old)
+    brane.refreshFields()
+    I = brane.I
+    brane.wavelets.remove(old)
+    brane.wavelets.append(new)
+    brane.refreshFields()
+    assert (brane.I is not I)
+
+
+def test_ThreadedBraneMatchesSerial():
+    brane = makeBraneWithTractors(40)
+    brane.wavelets.append(makeTractors(1, 600)[0]) # a plain wavelet too
+    brane.updateCoords()
+    I_ref, G_ref = brane.computeFieldsOnGrid(True, True)
+    G2_ref = brane.computeFieldsOnGrid(False, True, stride=3)[1]
+    
+    brane.parentUniverse.setBraneWorkers(3)
+    assert(brane.parentUniverse.braneWorkers == 3)
+    I, G = brane.computeFieldsOnGrid(True, True)
+    G2 = brane.computeFieldsOnGrid(False, True, stride=3)[1]
+    assert(brane.executor is not None)
+    assert(np.any(I_ref))
+    assert(np.allclose(I, I_ref))
+    assert(np.allclose(G, G_ref))
+    assert(np.allclose(G2, G2_ref))
+    
+    # resets hand the worker count to the new brane and stop old threads
+    brane.parentUniverse.reset()
+    assert(brane.executor is None)
+    assert(brane.parentUniverse.brane.workers == 3)
+
+
+def test_PipelinedBraneShowsEarlierFrames():
+    serial = makeBraneWithTractors(30)
+    brane = makeBraneWithTractors(30)
+    brane.parentUniverse.setBraneWorkers(2)
+    brane.setPipelined(True, latency=1)
+    brane.setColormap("abyss")
+    serial.setColormap("abyss")
+    
+    ref = []
+    centers = []
+    for frame in range(5):
+        for b in (serial, brane):
+            b.view.center[:] = [300. + 7*frame, 300. - 5*frame]
+            b.draw(b.view)
+            b.update(16.)
+        ref.append(pygame.surfarray.array3d(serial.surf))
+        centers.append(serial.view.center.copy())
+        
+        # first frame waits for its own layer, later ones are a frame behind
+        front = brane.pipeline.front
+        k = max(frame-1, 0)
+        assert (np.array_equal(pygame.surfarray.array3d(front.surf), ref[k]))
+        assert (np.all(front.view.center == centers[k]))
+        assert (len(brane.pipeline.inFlight) == (frame > 0))
+    assert (np.any(ref[0] != ref[-1]))
+    # stand-ins are recycled: one shown, one rendering, one free
+    assert (len(brane.pipeline.idle) == 1)
+    
+    # without latency each frame shows its own state
+    brane.setPipelined(True, latency=0)
+    serial.draw(serial.view)
+    brane.draw(brane.view)
+    assert (np.array_equal(pygame.surfarray.array3d(brane.pipeline.front.surf),
+                           pygame.surfarray.array3d(serial.surf)))
+    
+    # resets keep rendering in the background, shutdown stops the thread
+    brane.parentUniverse.reset()
+    assert (brane.pipeline.thread is None)
+    assert (brane.parentUniverse.brane.pipeline.latency == 0)
@@ -6,201 +6,192 @@ Created on Fri May 17 09:57:06 2024
 @author: zetadin
 """
 
-import sys
-sys.path.append("..") # enables entities import
-
-
-from multiprocessing import Process, Queue, Barrier, set_start_method
 from multiprocessing.shared_memory import SharedMemory
-from entities.Entity import SpriteEntity
 import numpy as np
-from time import sleep
+import pytest
+from BraneSpace.UI.View import View
+from BraneSpace.core.Universe import Universe
+from BraneSpace.entities.hazards.Asteroid import Asteroid
+from BraneSpace.entities.Player import Player
+from BraneSpace.tests.test_wavelets import makeTractors
+from BraneSpace.utils.SharedArena import SharedArena
+from BraneSpace.wavelets.Wavelet import Wavelet
 
 
+def makeUniverse(parallel, N=20, seed=5):
+    """
+    Universe with a thrusting player, N drifting asteroids and some Tractors.
+    """
+    np.random.seed(seed)
+    view = View()
+    universe = Universe(view, parallel=parallel, braneSurfScale=4.0)
+    player = Player(r = np.array([300.,300.]), v = np.zeros(2))
+    player.fwd = True
+    player.register(universe.brane)
+    for i in range(N):
+        roid = Asteroid()
+        roid.r = np.random.random(2)*600
+        roid.v = (np.random.random(2) - 0.5)*0.2
+        roid.register(universe.brane)
+    for wl in makeTractors(10, 600):
+        wl.register(universe.brane)
+    return(universe)
+
 
-class ParallelSpriteEntity(SpriteEntity):
+def entityPositions(universe):
     """
-    Entity update of which can be ofloaded to a subprocess.
+    Kind and position of every entity, in store order.
     """
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        
-        #overwrite r,v with shared memory substitutes
-        self.r_shm = SharedMemory(create=True, size=self.r.nbytes)
-        r = np.ndarray(shape=(2,), dtype=np.float64, buffer=self.r_shm.buf)
-        r[:] = self.r[:]
-        self.r = r
-        
-        self.v_shm = SharedMemory(create=True, size=self.v.nbytes)
-        v = np.ndarray(shape=(2,), dtype=np.float64, buffer=self.v_shm.buf)
-        v[:] = self.v[:]
-        self.v = v
-        
-        
+    return([(type(e).__name__, e.r) for e in universe.entities.owners])
 
-                
-    def update(self, dt: float):
-        """Update with a random force so no need to ask Brane."""
-        F = (np.random.random(2)-1.0)*0.1
-        
-        # acelleration
-        aNext = F/self.mass
-        # drag
-        aNext -= self.dragCoef * np.abs(self.v)*self.v
-        # velocity verlet
-        self.r += self.v*dt + 0.5*self.a
-        self.v += 0.5*dt*(self.a+aNext)
-        self.a = aNext
-        
-        print("Updating: r=", self.r)
-        
-    def __getstate__(self):
-        # pickle everything except the image ndarrays pointing to shared memory
-        # will be used for Queue insertion
-        disregard=["img","r","v"]
-        return {k:v for (k, v) in self.__dict__.items() if not k in disregard}
-    
-    def __setstate__(self, state):
-        # store all attributes when unpickling
-        self.__dict__.update(state)
-        
-        # add numpy arrays for SharedMemory regions
-        self.r = np.ndarray(shape=(2,), dtype=np.float64, buffer=self.r_shm.buf)
-        self.v = np.ndarray(shape=(2,), dtype=np.float64, buffer=self.v_shm.buf)
-        
-    def close(self):
-        print("closing shms:", self.r_shm.name, self.v_shm.name)
-        self.r_shm.close()
-        self.v_shm.close()
-        
-    def unlink(self):
-        print("unlinking shms:", self.r_shm.name, self.v_shm.name)
-        self.r_shm.unlink()
-        self.v_shm.unlink()
-    
-    
 
-class Worker(Process):
-    def __init__(self, creationQueue, destructionQueue, barrier, **kwargs):
-        super().__init__(**kwargs)
-        self.creationQueue = creationQueue
-        self.destructionQueue = destructionQueue
-        self.barrier = barrier
-        
-        self.myEntities = []
-        
+def assertSamePositions(pos, ref):
+    assert([kind for kind, r in pos] == [kind for kind, r in ref])
+    for (kind, r), (kind_ref, r_ref) in zip(pos, ref):
+        assert(np.allclose(r, r_ref))
 
-    def run(self):
-        while(True):
-            stop = False
-            # read input
-            while(not self.creationQueue.empty()):
-                e = self.creationQueue.get()
-                if(e != "STOP"):
-                    self.myEntities.append(e)
-                else:
-                    stop=True
-                    
-            # exit if asked to
-            if(stop):
-                from multiprocessing.resource_tracker import unregister
-                for e in self.myEntities:
-                    # close shared memory for Worker process
-                    e.close()
-                    # unregister it from resource_tracker
-                    # it got registered there a second time when unpickled
-                    # from Queue
-                    unregister(e.r_shm._name, "shared_memory")
-                    unregister(e.v_shm._name, "shared_memory")
-                    # tell GUI side to delete Entity as well
-                    self.destructionQueue.put(e.drawablesKey)
-                del self.myEntities
-                
-                # don't end process until GUI process unlinks SharedMemory
-                self.barrier.wait()
-                self.barrier.reset()
-                print("Worker waiting to exit.")
-                self.barrier.wait()
-                print("Worker exiting.")
-                break
-            
-            # update the entities
-            dt = 1.
-            for e in self.myEntities:
-                e.update(dt)
-            
-            sleep(0.02)
-            
-                    
-
-def test_shared_memory():
-    
-    set_start_method('fork')
+
+def run(universe, steps, dt=16., hazards=0):
+    """
+    Step the universe, keeping at least hazards asteroids around
+    by spawning growing ones, as the game does.
+    """
+    for s in range(steps):
+        universe.update(dt)
+        universe.collisionDetect(dt)
+        roids = sum(type(c) is Asteroid for c in universe.collidables)
+        for k in range(hazards - roids):
+            roid = Asteroid.pool.acquire()
+            roid.grow = True
+            roid.size = 0.
+            roid.collisionRadius = 0.
+            roid.r = np.random.random(2)*600
+            roid.v = (np.random.random(2) - 0.5)*0.5
+            universe.requestSpawn(roid)
+        universe.commit()
+
+
+def test_SharedArenaAttachSeesSameArrays():
+    arena = SharedArena({"r": ((2,10,2), float), "alive": ((2,10), bool),
+                         "theta": ((2,10), np.float32)})
+    other = SharedArena.attach(arena.layout())
+    try:
+        for name, arr in arena.arrays.items():
+            assert(arr.ctypes.data % SharedArena.align == 0)
+            assert(not np.any(arr))
+            assert(other.arrays[name].shape == arr.shape)
+        arena.arrays["r"][0,3] = [1., 2.]
+        other.arrays["alive"][1,4] = True
+        assert(np.all(other.arrays["r"][0,3] == [1., 2.]))
+        assert(arena.arrays["alive"][1,4])
+    finally:
+        assert(other.close())
+        assert(arena.close())
+        arena.unlink()
+
+
+def test_ParallelPhysicsMatchesSerial():
+    """
+    Long enough for many collisions with growing asteroids and explosions,
+    whose radii change in their update().
+    """
+    serial = makeUniverse(False, N=40)
+    run(serial, 150, hazards=40)
+    ref = entityPositions(serial)
+
+    parallel = makeUniverse(True, N=40)
+    try:
+        assert(parallel.physics.process.is_alive())
+        run(parallel, 150, hazards=40)
+        pos = entityPositions(parallel)
+    finally:
+        parallel.shutdown()
+
+    # same collisions destroyed and spawned the same entities
+    assert(any(kind == "DarkMatter" for kind, r in ref))
+    assert(any(kind == "Explosion" for kind, r in ref))
+    assertSamePositions(pos, ref)
+
+
+def test_StartedStepJoinsBeforeStoreChanges():
+    serial = makeUniverse(False, N=5)
+    serial.update(16.)
+    ref = entityPositions(serial)
+
+    universe = makeUniverse(True, N=5)
+    try:
+        start = entityPositions(universe)
+        universe.startPhysicsStep(16.)
+        # drawing reads the current state while the step runs
+        assert(all(np.all(e.r == r)
+                   for e, (kind, r) in zip(universe.entities.owners, start)))
+
+        # adding an entity waits for the step and publishes it
+        roid = Asteroid()
+        roid.r = np.array([10., 20.])
+        roid.register(universe.brane)
+        assert(not universe.physics.inFlight)
+
+        # the next update uses the started step instead of running another
+        universe.update(16.)
+        pos = entityPositions(universe)
+    finally:
+        universe.shutdown()
+
+    kind, r = pos.pop()
+    assert(kind == "Asteroid" and np.all(r == [10., 20.]))
+    assertSamePositions(pos, ref)
+
+
+def test_StartedStepsMatchSerialForces():
+    """
+    Steps started ahead see the brane as the update leaves it,
+    and are redone if the game changed something they depend on.
+    """
+    states = []
+    for parallel in (False, True):
+        universe = makeUniverse(parallel, N=8)
+        for k in range(4): # plain wavelets that change every step
+            wl = Wavelet(v = 12.8e-2, L = 32.0, A = 0.1,
+                         source = np.array([150.*k, 300.]),
+                         maxLifetime = 2000.)
+            wl.lifetime = 300.*k
+            wl.register(universe.brane)
         
-    cQ = Queue()
-    dQ = Queue()
-    
-    # create Process
-    barrier = Barrier(2) # 2 processes
-    worker = Worker(cQ, dQ, barrier)
-    worker.start()
-    
-    # create Entity
-    sharedEnt = ParallelSpriteEntity(mass=100.0, drag=0.3)
-    sharedEnt.r[:] = [5.0,5.0]
-    sharedEnt.v[:] = [0.01,-0.01]
-    
-    # store Entity into dict of drawables
-    drawables = {} # a dict with unique keys
-    lastDrawablesKey = -1
-    lastDrawablesKey+=1
-    drawables[lastDrawablesKey] = sharedEnt
-    sharedEnt.drawablesKey = lastDrawablesKey
-    
-    cQ.put(sharedEnt)
-    del sharedEnt
-    
-    # wait and read new position
-    sleep(0.1)
-    print("Reading: r=", drawables[lastDrawablesKey].r)
-    # check that we see position change in GUI process
-    assert(np.all(drawables[lastDrawablesKey].r != 5.0))
-    
-    # stop Worker Process
-    cQ.put("STOP")
-    cQ.close()
-    
-    # wait for Worker to put all remaining entities into dQ
-    barrier.wait()
-    print("GUI freeing memory.")
-    
-    # handle any events in the destruction Queue
-    while(not dQ.empty()):
-        key = dQ.get()
-        # close shared memory for GUI side
-        drawables[key].close()
-        # free shared memory for GUI side
-        drawables[key].unlink()
-        # remove Entity from drawables
-        del drawables[key]
-    dQ.close()
-    
-    # wait for worker to finish
-    barrier.wait()
-    print("GUI waiting for Worker to exit.")
-    worker.join()
-    sleep(0.2)
-    print("GUI exiting.")
-    
-#    print("\n\nResourceTracker record:")
-#    from multiprocessing.resource_tracker import getfd
-#    fd = getfd()
-#    with open(fd, 'rb') as f:
-#            for line in f:
-#                print(line)
+        states.append([])
+        try:
+            for s in range(12):
+                universe.update(16.)
+                universe.collisionDetect(16.)
+                universe.commit()
+                universe.startPhysicsStep(16.)
+                if(s == 5): # cut thrust while the started step runs
+                    universe.entities.owners[0].fwd = False
+                
+                store = universe.entities
+                n = len(store)
+                states[-1].append(np.concatenate([store.v[:n], store.a[:n]]))
+        finally:
+            universe.shutdown()
+    
+    for ref, state in zip(*states):
+        assert(np.any(ref != 0.))
+        assert(np.allclose(state, ref, rtol=0., atol=1e-12))
 
-    
-    
-    
-if __name__ == "__main__":
-    test_shared_memory()
\ No newline at end of file
+
+def test_ShutdownFreesSharedMemory():
+    universe = makeUniverse(True, N=5)
+    store = universe.entities
+    run(universe, 3)
+    names = [store.arena.shm.name]
+    store.reserve(4*store.capacity) # columns move to a new arena
+    names.append(store.arena.shm.name)
+    run(universe, 3)
+    process = universe.physics.process
+
+    universe.shutdown()
+    assert(not process.is_alive())
+    assert(universe.physics is None)
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import BraneSpace.core.GlobalRules as GlobalRules
+from BraneSpace.wavelets.Tractor import Tractor
+from BraneSpace.wavelets.TractorStore import TractorStore
+from BraneSpace.wavelets.Wavelet import Wavelet
+
+
+def makeTractors(N, uniSize):
+    """
+    Random Tractors at various stages of their lifetime.
+    """
+    rng = np.random.default_rng(42)
+    tractors = []
+    for i in range(N):
+        wl = Tractor(source=rng.random(2)*uniSize,
+                     direction=rng.random(2)-0.5,
+                     v = 12.8e-2, L = 32.0,
+                     A = rng.choice([-0.1, 0.1]),
+                     Rmax = 180.)
+        wl.lifetime = rng.random()*wl.maxLifetime
+        tractors.append(wl)
+    return(tractors)
+
+
+def referenceTractorFields(wl, x):
+    """
+    Intensity and gradient of a single Tractor, computed without
+    the shared kernel, as a reference for the batched implementations.
+    """
+    rprime = x - wl.R[np.newaxis,:]
+    uniSize = GlobalRules.curUniverseSize
+    if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+        ab = np.abs(rprime)
+        rprime[ab > np.abs(rprime + uniSize)] += uniSize
+        rprime[ab > np.abs(x - wl.R[np.newaxis,:] - uniSize)] -= uniSize
+    rlen = np.linalg.norm(rprime, axis=-1)
+
+    W = 1.0 - 2.0*np.abs(rlen - wl.v*wl.lifetime)/wl.L
+    cosTheta = np.dot(rprime, wl.dir)/rlen
+    mask = (W > 0.) & (rlen < wl.Rmax) & (cosTheta > np.cos(wl.theta0))
+    rlen = rlen[mask]
+    rprime = rprime[mask]
+    cosTheta = cosTheta[mask]
+    W = W[mask]
+
+    Id = wl.A*(np.sqrt(wl.Rmax) - np.sqrt(rlen))
+    Ia = cosTheta - np.cos(wl.theta0)
+    I = np.zeros(x.shape[0])
+    I[mask] = W * Id * Ia
+
+    gradrprime = rprime/rlen[:,np.newaxis]
+    gradId = (wl.A*(np.sqrt(wl.Rmax) + 0.5/np.sqrt(rlen)))[:,np.newaxis]*gradrprime
+    gradIa = wl.dir[np.newaxis,:] - (cosTheta[:,np.newaxis]*gradrprime)/(rlen*rlen)[:,np.newaxis]
+    relpos = rlen - wl.v*wl.lifetime
+    gradW = np.where((relpos>0) & (relpos<0.5*wl.L), -2.0/wl.L, 0.0)
+    gradW = np.where((relpos<0) & (relpos>-0.5*wl.L), +2.0/wl.L, gradW)
+    gradW = gradW[:,np.newaxis]*gradrprime
+    G = np.zeros(x.shape)
+    G[mask] = (gradId*Ia[:,np.newaxis] + Id[:,np.newaxis]*gradIa)*W[:,np.newaxis] + \
+              (Id*Ia)[:,np.newaxis]*gradW
+    return(I, G)
+
+
+def test_TractorStoreMatchesTractors():
+    GlobalRules.pbc = GlobalRules.PBC.TOROIDAL
+    GlobalRules.curUniverseSize = 600
+
+    tractors = makeTractors(20, 600)
+    x = np.random.default_rng(1).random((5000,2))*600
+
+    # reference: one wavelet at a time
+    I_ref = np.zeros(x.shape[0])
+    G_ref = np.zeros(x.shape)
+    for wl in tractors:
+        I, G = referenceTractorFields(wl, x)
+        I_ref += I
+        G_ref += G
+
+        # fused evaluation of a single wavelet
+        I_wl, G_wl = wl.eval(x, want_f=True, want_grad=True)
+        assert(np.allclose(I_wl, I))
+        assert(np.allclose(G_wl, G))
+
+    # batched
+    store = TractorStore(capacity=4) # force growth
+    for wl in tractors:
+        store.add(wl)
+    I, G = store.eval(x, want_f=True, want_grad=True)
+
+    assert(np.allclose(I, I_ref))
+    assert(np.allclose(G, G_ref))
+
+
+def test_TractorStoreExpiry():
+    GlobalRules.pbc = GlobalRules.PBC.TOROIDAL
+    GlobalRules.curUniverseSize = 600
+
+    tractors = makeTractors(10, 600)
+    store = TractorStore()
+    for wl in tractors:
+        store.add(wl)
+
+    # advance until about half have expired
+    dt = np.median([wl.maxLifetime - wl.lifetime for wl in tractors])
+    store.update(dt)
+
+    survivors = [wl for wl in tractors if wl._store is store]
+    assert(len(store) == len(survivors))
+    for slot, wl in enumerate(store.owners):
+        assert(wl._slot == slot)
+        assert(wl.lifetime <= wl.maxLifetime)
+    # expired wavelets keep their state after leaving the store
+    for wl in tractors:
+        if(wl._store is None):
+            assert(wl.lifetime > wl.maxLifetime)
+
+
+def test_TractorStoreGridCulling():
+    GlobalRules.pbc = GlobalRules.PBC.TOROIDAL
+    GlobalRules.curUniverseSize = 600
+
+    store = TractorStore()
+    for wl in makeTractors(30, 600):
+        store.add(wl)
+
+    # grids offset from the primary cell, one wider than the universe
+    for shape, origin, spacing in [((150,150), np.array([-37.,212.]), 4.),
+                                   ((90,70), np.array([-500.,-10.]), 8.)]:
+        xs = np.mod(origin[0] + np.arange(shape[0])*spacing, 600)
+        ys = np.mod(origin[1] + np.arange(shape[1])*spacing, 600)
+        coords = np.stack(np.meshgrid(xs, ys, indexing='ij'), axis=-1)
+
+        I_ref, G_ref = store.eval(coords.reshape(-1,2), True, True)
+        I, G = store.evalGrid(xs, ys, origin, spacing, True, True)
+
+        assert(np.allclose(I, I_ref.reshape(shape)))
+        assert(np.allclose(G, G_ref.reshape(shape+(2,))))
+
+
+def test_WaveletSeparableGrid():
+    GlobalRules.pbc = GlobalRules.PBC.TOROIDAL
+    GlobalRules.curUniverseSize = 600
+
+    xs = np.mod(-37. + np.arange(160)*4., 600)
+    ys = np.mod(212. + np.arange(120)*4., 600)
+    coords = np.stack(np.meshgrid(xs, ys, indexing='ij'), axis=-1)
+    wavelets = makeTractors(10, 600)
+    for k in range(4):
+        wl = Wavelet(v = 12.8e-2, L = 32.0, A = 0.1,
+                     source = np.array([150.*k, 300.]), maxLifetime = 2000.)
+        wl.lifetime = 400. + 300.*k
+        wavelets.append(wl)
+    for wl in wavelets:
+        I_ref, G_ref = wl.eval(coords, True, True)
+        I, G = wl.evalGrid(xs, ys, True, True)
+        assert(np.allclose(I, I_ref))
+        assert(np.allclose(G, G_ref))
+    assert(np.any(I_ref))
+
+
+def test_TractorBoundingBox():
+    GlobalRules.pbc = GlobalRules.PBC.NONE
+
+    x = np.random.default_rng(2).random((20000,2))*800 - 100
+    for wl in makeTractors(10, 600):
+        box = wl.boundingBox()
+        I = wl.f(x)
+        if(box is None):
+            assert(not np.any(I))
+        else:
+            inside = np.all((x >= box[:2]) & (x <= box[2:]), axis=-1)
+            assert(not np.any(I[~inside]))
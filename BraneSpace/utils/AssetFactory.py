@@ -7,6 +7,7 @@ Created on Mon Jul  1 12:30:55 2024
 """
 import glob
 import os
+import numpy as np
 import pygame
 import tqdm
 import BraneSpace
@@ -55,6 +56,34 @@ class AssetFactory():
          
          return(img)
          
+     def loadAlphaFrames(self, file: str, width: int=None, levels: int=16):
+         """
+         Copies of an image in which every visible pixel has the same alpha,
+         evenly spaced from 0 (invisible) to 255 (opaque).
+         Generated once and shared, so fading sprites only pick a frame
+         with alphaFrame() instead of rewriting their own pixels.
+         width : scale the copies to this many pixels wide, the most
+                 they are drawn at, so they stay small.
+         """
+         key=file+"__alpha_frames="+str(levels)+"__width="+str(width)
+         if(key in self.preloaded_imgs.keys()):
+             return(self.preloaded_imgs[key])
+         
+         img = self.loadImg(file, True)
+         if(width is not None and width < img.get_width()):
+             height = max(int(round(img.get_height()*width/img.get_width())), 1)
+             img = pygame.transform.smoothscale(img, (width, height))
+         frames = []
+         for k in range(levels):
+             frame = img.copy()
+             img_a = np.array(frame.get_view('A'), copy=False)
+             img_a[img_a>0] = round(255*k/(levels-1))
+             del img_a # to unlock frame and allow blit
+             frames.append(frame)
+         self.preloaded_imgs[key]=frames
+         
+         return(frames)
+         
      def registerProceduralImg(self, key, img):
          self.preloaded_imgs[key]=img
          
@@ -64,5 +93,12 @@ class AssetFactory():
      def loadProceduralImg(self, key: str):
          return(self.preloaded_imgs[key])
          
+def alphaFrame(frames: list, alpha: float):
+    """
+    Frame from AssetFactory.loadAlphaFrames() closest to alpha in [0,255].
+    """
+    k = int(alpha*(len(frames)-1)/255. + 0.5)
+    return(frames[min(max(k, 0), len(frames)-1)])
+
 # exported objects:
 assetFactory = AssetFactory()
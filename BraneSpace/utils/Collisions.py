@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from BraneSpace.utils.Geometry import shift_arr
+
+
+# Cell offsets of a 3x3 neighbourhood
+neighbour_offsets = np.array([[dx, dy] for dx in (-1,0,1) for dy in (-1,0,1)])
+
+
+def minimumImage(d, uniSize=None):
+    """
+    Wrap displacements to the nearest periodic image, in place.
+    No-op if uniSize is None.
+    """
+    if(uniSize is not None):
+        d -= uniSize*np.round(d/uniSize)
+    return(d)
+
+
+def sweptCircleHits(start, end, centers, radius, uniSize=None):
+    """
+    Segment-circle overlap test for K segments at once.
+    start, end : segment end points in shape (K,2).
+    centers : circle centers in shape (K,2).
+    radius : circle radii in shape (K,).
+    uniSize : periodic box size; if set, every periodic image
+              of the circles is tested. None without PBC.
+    Returns a boolean hit mask of shape (K,).
+    """
+    vdt = end - start # start to end
+    if(uniSize is not None):
+        c = centers[:,np.newaxis,:] + shift_arr*uniSize # (K,9,2)
+    else:
+        c = centers[:,np.newaxis,:]
+    cx = c - start[:,np.newaxis,:] # start to center
+    ce = c - end[:,np.newaxis,:]   # end to center
+    
+    R_sq = (radius*radius)[:,np.newaxis]
+    cx_sq = np.einsum("kij,kij->ki", cx, cx)
+    ce_sq = np.einsum("kij,kij->ki", ce, ce)
+    
+    # projection of center onto the segment
+    vdt_sq = np.einsum("ij,ij->i", vdt, vdt)[:,np.newaxis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        u = np.einsum("kij,kj->ki", cx, vdt)/vdt_sq
+    d_sq = cx_sq - u*u*vdt_sq # closest distance to center ^2
+    
+    # end points in radius or closest point of segment in radius
+    hit = (cx_sq <= R_sq) | (ce_sq <= R_sq) | \
+          ((u >= 0.) & (u <= 1.) & (d_sq <= R_sq))
+    return(np.any(hit, axis=-1))
+
+
+def broadphasePairs(r, sweptRadius, uniSize=None):
+    """
+    Candidate pairs for collision detection from a uniform cell grid.
+    r : positions in shape (n,2).
+    sweptRadius : radius around r that each object can reach during
+                  the step, i.e. collision radius plus length of the step.
+    uniSize : periodic box size for toroidal wrap, None without PBC.
+    Returns index arrays (i, j) with i<j, sorted by i then j, of all pairs
+    whose swept circles overlap. Pairs that are not returned can't collide.
+    """
+    n = r.shape[0]
+    if(n < 2):
+        return(np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+
+    # cells at least as wide as the largest pair of overlapping circles
+    cellSize = max(2.*np.max(sweptRadius), 1e-6)
+
+    if(uniSize is not None):
+        m = int(uniSize//cellSize) # cells per side
+        if(m < 3):
+            # neighbourhoods would cover the box several times over
+            i, j = np.triu_indices(n, k=1)
+            return(_overlapping(r, sweptRadius, i, j, uniSize))
+        cellSize = uniSize/m
+        cell = np.floor(np.mod(r, uniSize)/cellSize).astype(int)
+        cell = np.minimum(cell, m-1) # guard against rounding up to uniSize
+        nbr = np.mod(cell[:,np.newaxis,:] + neighbour_offsets, m)
+        cid = cell[:,0]*m + cell[:,1]
+        nid = nbr[:,:,0]*m + nbr[:,:,1]
+    else:
+        cell = np.floor(r/cellSize).astype(int)
+        cell -= np.min(cell, axis=0) - 1 # leave room for the neighbours
+        h = np.max(cell[:,1]) + 2
+        nbr = cell[:,np.newaxis,:] + neighbour_offsets
+        cid = cell[:,0]*h + cell[:,1]
+        nid = nbr[:,:,0]*h + nbr[:,:,1]
+
+    # objects sorted by cell, and where each neighbour cell starts and ends
+    order = np.argsort(cid, kind='stable')
+    sorted_cid = cid[order]
+    starts = np.searchsorted(sorted_cid, nid, side='left').ravel()
+    counts = np.searchsorted(sorted_cid, nid, side='right').ravel() - starts
+
+    # every object against every object in its neighbourhood
+    i = np.repeat(np.repeat(np.arange(n), neighbour_offsets.shape[0]), counts)
+    t = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts)-counts, counts)
+    j = order[np.repeat(starts, counts) + t]
+
+    # each unordered pair is found from both sides, keep one
+    keep = i < j
+    return(_overlapping(r, sweptRadius, i[keep], j[keep], uniSize))
+
+
+def collisionPairs(r, dr, radius, uniSize=None):
+    """
+    All pairs of circles that touch during a step.
+    A spatial hash broadphase picks the pairs that can possibly touch
+    and a vectorized segment-circle test checks them all at once.
+    r : positions at the end of the step in shape (n,2).
+    dr : displacements during the step in shape (n,2).
+    radius : collision radii in shape (n,).
+    uniSize : periodic box size for toroidal wrap, None without PBC.
+    Returns index arrays (i, j) with i<j, sorted by i then j.
+    """
+    # broadphase
+    swept = radius + np.sqrt(np.einsum("ij,ij->i", dr, dr))
+    ci, cj = broadphasePairs(r, swept, uniSize)
+    
+    # narrow phase: i's relative motion against a stationary j
+    vdt = dr[ci] - dr[cj]
+    hit = sweptCircleHits(r[ci] - vdt, r[ci], r[cj],
+                          radius[ci] + radius[cj], uniSize)
+    return(ci[hit], cj[hit])
+
+
+def _overlapping(r, sweptRadius, i, j, uniSize):
+    """
+    Keep only pairs with overlapping swept circles, sorted by i then j.
+    """
+    d = minimumImage(r[j] - r[i], uniSize)
+    reach = sweptRadius[i] + sweptRadius[j]
+    keep = np.einsum("ij,ij->i", d, d) <= reach*reach
+    i = i[keep]
+    j = j[keep]
+    order = np.lexsort((j, i))
+    return(i[order], j[order])
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import numpy.typing as npt
+
+
+def linearColormap(colors: list) -> npt.ArrayLike:
+    """
+    256 entry RGB lookup table interpolating between evenly spaced colors.
+    """
+    colors = np.asarray(colors, dtype=float)
+    x = np.linspace(0., 1., colors.shape[0])
+    t = np.linspace(0., 1., 256)
+    lut = np.stack([np.interp(t, x, colors[:,c]) for c in range(3)], axis=-1)
+    return(np.round(lut).astype(np.uint8))
+
+
+# Brane intensity maps to index 128 when flat,
+# so diverging maps have their neutral color in the middle.
+colormaps = {
+    "grey": linearColormap([(0,0,0), (255,255,255)]),
+    "coolwarm": linearColormap([(59,76,192), (221,221,221), (180,4,38)]),
+    "abyss": linearColormap([(0,0,0), (20,30,90), (90,200,220),
+                             (255,255,255)]),
+}
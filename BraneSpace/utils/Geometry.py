@@ -26,4 +26,77 @@ def expandPeriodicImages(r, uniSize):
     return(r[...,np.newaxis,:] + shift_arr*uniSize)
     
 # helper function for computing distance squared
-selfdot = lambda x : np.dot(x,x)
\ No newline at end of file
+selfdot = lambda x : np.dot(x,x)
+
+
+def interpolateStep(r, dr, alpha):
+    """
+    Position a fraction alpha of the way through the step that moved
+    r by dr, for drawing between fixed time steps.
+    Works on single positions and on rows of them.
+    May lie just outside the periodic box.
+    """
+    return(r - (1. - alpha)*dr)
+
+
+def annularSectorBoxes(R, direction, rin, rout, theta0):
+    """
+    Axis-aligned bounding boxes of annular sectors centered at R,
+    spanning radii [rin, rout] and angles within theta0 of direction.
+    All arguments are arrays over sectors; R and direction have shape (n,2).
+    Returns boxes as rows of [xmin, ymin, xmax, ymax] in shape (n,4).
+    """
+    phi0 = np.arctan2(direction[:,1], direction[:,0])
+    
+    # corners of the sector
+    phis = phi0[:,np.newaxis] + np.array([-1.,1.])*theta0[:,np.newaxis]
+    unit = np.stack((np.cos(phis), np.sin(phis)), axis=-1) # (n,2,2)
+    pts = [R[:,np.newaxis,:] + rin[:,np.newaxis,np.newaxis]*unit,
+           R[:,np.newaxis,:] + rout[:,np.newaxis,np.newaxis]*unit]
+    
+    # outer arc reaches along an axis if that direction is inside the cone
+    axes = np.array([[1.,0.], [0.,1.], [-1.,0.], [0.,-1.]])
+    delta = np.arctan2(axes[:,1], axes[:,0])[np.newaxis,:] - phi0[:,np.newaxis]
+    delta = np.abs(np.arctan2(np.sin(delta), np.cos(delta))) # wrap to [0,pi]
+    inside = delta <= theta0[:,np.newaxis]
+    axis_pts = R[:,np.newaxis,:] + rout[:,np.newaxis,np.newaxis]*axes
+    # replace unreached axis points with a corner so they don't widen box
+    pts.append(np.where(inside[:,:,np.newaxis], axis_pts, pts[1][:,:1,:]))
+    
+    pts = np.concatenate(pts, axis=1)
+    return(np.concatenate((pts.min(axis=1), pts.max(axis=1)), axis=-1))
+
+
+def periodicAxisRanges(lo, hi, origin, spacing, n, uniSize=None):
+    """
+    Index ranges on a regular grid axis (origin + i*spacing, i<n)
+    covered by intervals [lo, hi] and, if uniSize is set, by their
+    periodic images. Intervals at least uniSize wide cover the whole axis.
+    Returns inclusive (i0, i1) and validity of each range, all in shape (m,k)
+    for m intervals and up to k images each.
+    """
+    end = origin + (n-1)*spacing
+    if(uniSize is None):
+        shifts = np.zeros((lo.shape[0],1))
+        valid = np.ones(shifts.shape, dtype=bool)
+    else:
+        # which images of each interval overlap the axis?
+        kmin = np.ceil((origin - hi)/uniSize)
+        kmax = np.floor((end - lo)/uniSize)
+        k = kmin[:,np.newaxis] + np.arange(max(1, int(np.max(kmax-kmin, initial=0))+1))
+        valid = k <= kmax[:,np.newaxis]
+        shifts = k*uniSize
+        
+    i0 = np.ceil((lo[:,np.newaxis] + shifts - origin)/spacing)
+    i1 = np.floor((hi[:,np.newaxis] + shifts - origin)/spacing)
+    valid &= (i0 <= i1) & (i0 <= n-1) & (i1 >= 0)
+    if(uniSize is not None):
+        # wide intervals overlap their own images; cover the axis once
+        wide = np.logical_and(hi - lo >= uniSize, lo <= hi)
+        i0[wide] = 0
+        i1[wide] = n-1
+        valid[wide] = False
+        valid[wide,0] = True
+    i0 = np.clip(i0, 0, n-1).astype(int)
+    i1 = np.clip(i1, 0, n-1).astype(int)
+    return(i0, i1, valid)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+class ObjectPool():
+    """
+    Recycles released instances of one class.
+    acquire() hands out a released instance after calling its
+    reset(*args, **kwargs), or constructs a new one with the same arguments
+    if none is free. Pooled classes keep a pool as the class attribute pool.
+    """
+    def __init__(self, cls: type, maxFree: int = 256):
+        self.cls = cls
+        self.maxFree = maxFree  # released instances beyond this are dropped
+        self.free = []
+        self.hits = 0           # acquires served from the free list
+        self.misses = 0         # acquires that had to construct
+
+    def acquire(self, *args, **kwargs):
+        if(self.free):
+            obj = self.free.pop()
+            obj.reset(*args, **kwargs)
+            self.hits += 1
+        else:
+            obj = self.cls(*args, **kwargs)
+            self.misses += 1
+        return(obj)
+
+    def release(self, obj):
+        """
+        Return an instance to the pool.
+        Nothing else may keep using it afterwards.
+        """
+        if(len(self.free) < self.maxFree):
+            self.free.append(obj)
+
+    def stats(self) -> dict:
+        return({"hits": self.hits, "misses": self.misses,
+                "free": len(self.free)})
+
+
+def releaseToPool(obj):
+    """
+    Release obj to the pool of its class, if that class is pooled.
+    Subclasses of a pooled class are not recycled by their parent's pool.
+    """
+    pool = getattr(type(obj), "pool", None)
+    if(pool is not None and pool.cls is type(obj)):
+        pool.release(obj)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import pygame
+
+
+class RotozoomCache():
+    """
+    Least recently used cache of rotated and scaled sprite images.
+    Angles are quantized to angleStep degrees and zooms to whole pixels of
+    output width, so slowly rotating or growing sprites mostly reuse
+    surfaces made in earlier frames. Oldest entries are evicted once the
+    cached surfaces take up more than maxBytes.
+    """
+    def __init__(self, angleStep: float = 2.0, maxBytes: int = 32*1024*1024):
+        self.angleStep = angleStep  # degrees
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict() # (img, angle bin, width) -> surface
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def rotozoom(self, img: pygame.Surface, angle: float, zoom: float):
+        """
+        Like pygame.transform.rotozoom(img, angle, zoom), served from cache.
+        Returns None if the scaled image would be less than a pixel wide.
+        """
+        width = int(round(zoom*img.get_width()))
+        if(width < 1):
+            return(None)
+        nbins = int(round(360./self.angleStep))
+        abin = int(round(angle/self.angleStep)) % nbins
+        key = (img, abin, width)
+
+        surf = self.entries.get(key)
+        if(surf is not None):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return(surf)
+
+        self.misses += 1
+        surf = pygame.transform.rotozoom(img, abin*self.angleStep,
+                                         width/img.get_width())
+        self.entries[key] = surf
+        self.bytes += surf.get_width()*surf.get_height()*surf.get_bytesize()
+        while(self.bytes > self.maxBytes and len(self.entries) > 1):
+            k, old = self.entries.popitem(last=False)
+            self.bytes -= old.get_width()*old.get_height()*old.get_bytesize()
+        return(surf)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def hitRate(self) -> float:
+        total = self.hits + self.misses
+        return(self.hits/total if total else 0.)
+
+    def stats(self) -> dict:
+        return({"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hitRate(), "entries": len(self.entries),
+                "bytes": self.bytes})
+
+# exported objects:
+rotozoomCache = RotozoomCache()
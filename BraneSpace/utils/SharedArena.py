@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+
+class SharedArena():
+    """
+    One shared memory block holding several named arrays,
+    each starting at an aligned offset.
+    Other processes attach to all of them at once with the arena's layout(),
+    so only one segment has to be created, passed around and unlinked.
+    """
+    align = 64 # bytes, so arrays start on their own cache lines
+
+    def __init__(self, fields: dict, name: str = None):
+        """
+        fields : array name -> (shape, dtype).
+        name : segment to attach to. A new one is created if None.
+        """
+        self.fields = {k: (tuple(shape), np.dtype(dtype).str)
+                       for k, (shape, dtype) in fields.items()}
+        offsets = {}
+        size = 0
+        for k, (shape, dtype) in self.fields.items():
+            offsets[k] = size
+            nbytes = int(np.prod(shape))*np.dtype(dtype).itemsize
+            size += -(-nbytes//self.align)*self.align
+
+        if(name is None):
+            self.shm = SharedMemory(create=True, size=max(size, 1))
+        else:
+            self.shm = SharedMemory(name=name)
+        self.arrays = {k: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf,
+                                     offset=offsets[k])
+                       for k, (shape, dtype) in self.fields.items()}
+        if(name is None):
+            for arr in self.arrays.values():
+                arr[...] = 0
+
+    @classmethod
+    def attach(cls, layout: tuple) -> "SharedArena":
+        """
+        Attach to an arena made in another process from its layout().
+        """
+        name, fields = layout
+        return(cls(fields, name))
+
+    def layout(self) -> tuple:
+        """
+        Segment name and fields, enough to attach from another process.
+        """
+        return((self.shm.name, self.fields))
+
+    def close(self) -> bool:
+        """
+        Unmap the arena from this process.
+        Returns False if something still holds a view into it;
+        it is then closed when the views are gone.
+        """
+        self.arrays = {}
+        try:
+            self.shm.close()
+        except BufferError:
+            return(False)
+        return(True)
+
+    def unlink(self):
+        """
+        Free the segment once all processes closed it.
+        Only the creator should call this.
+        """
+        self.shm.unlink()
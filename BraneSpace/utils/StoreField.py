@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class StoreField:
+    """
+    Attribute that lives in a column of a packed store, like TractorStore,
+    while its object is registered there, and in the instance otherwise.
+    The store keeps the object's row index in obj._slot.
+    Vector fields read from a store are copies: rows move when entries are
+    swap-removed or the columns are reallocated, so a view into them could
+    later alias another object's row. Write back by assignment;
+    augmented assignment like obj.r += dr does that too.
+    Writes through an object bump the store's version.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if(obj is None):
+            return(self)
+        store = obj.__dict__.get("_store")
+        if(store is None):
+            try:
+                return(obj.__dict__[self.name])
+            except KeyError:
+                raise AttributeError(self.name) from None
+        value = getattr(store, self.name)[obj._slot]
+        if(isinstance(value, np.ndarray)):
+            return(value.copy())
+        return(value)
+
+    def __set__(self, obj, value):
+        store = obj.__dict__.get("_store")
+        if(store is None):
+            obj.__dict__[self.name] = value
+        else:
+            getattr(store, self.name)[obj._slot] = value
+            store.version += 1
@@ -9,12 +9,25 @@ Created on Wed May 15 10:21:47 2024
 import numpy as np
 import numpy.typing as npt
 import pygame
-import BraneSpace.core.GlobalRules as GlobalRules
-from BraneSpace.utils.Geometry import expandPeriodicImages
+from BraneSpace.utils.Geometry import annularSectorBoxes
 from BraneSpace.wavelets.Wavelet import Wavelet
+from BraneSpace.wavelets.TractorStore import tractorKernel
+from BraneSpace.utils.StoreField import StoreField
+from BraneSpace.utils.ObjectPool import ObjectPool
 
 
 class Tractor(Wavelet, pygame.sprite.Sprite):
+    # Once registered, these live in the Brane's TractorStore
+    R = StoreField()
+    dir = StoreField()
+    v = StoreField()
+    L = StoreField()
+    A = StoreField()
+    Rmax = StoreField()
+    theta0 = StoreField()
+    lifetime = StoreField()
+    maxLifetime = StoreField()
+    
     def __init__(self, source: npt.ArrayLike,
                  direction: npt.ArrayLike,
                  v: float = 3.2e-2,
@@ -23,7 +36,25 @@ class Tractor(Wavelet, pygame.sprite.Sprite):
                  Rmax: float = 128.0,
                  theta0: float = np.pi/6.0,
                  debug=False):
-        
+        # registration
+        self.parentBrane = None
+        self._store = None
+        self._slot = None
+        self.setup(source, direction, v, L, A, Rmax, theta0, debug)
+        
+        
+    def setup(self, source: npt.ArrayLike,
+              direction: npt.ArrayLike,
+              v: float = 3.2e-2,
+              L: float = 16,
+              A: float = 0.1,
+              Rmax: float = 128.0,
+              theta0: float = np.pi/6.0,
+              debug=False):
+        """
+        Set every parameter and the lifetime of a new Tractor.
+        Shared by the constructor and reset().
+        """
         self.v = v
         self.L = L
         self.A = A
@@ -37,9 +68,6 @@ class Tractor(Wavelet, pygame.sprite.Sprite):
         self.maxLifetime = (self.Rmax + self.L)/self.v
         self.lifetime = 0
         
-        # registration
-        self.parentBrane = None
-        
         # debug
         self.debug = debug
         if(self.debug):
@@ -54,16 +82,40 @@ class Tractor(Wavelet, pygame.sprite.Sprite):
                     )
         
         
+    def reset(self, *args, **kwargs):
+        """
+        Reuse a released Tractor, see ObjectPool.
+        Takes the same arguments as the constructor.
+        Released Tractors are already out of their store.
+        """
+        self.parentBrane = None
+        self.__dict__.pop("alive", None) # set by the Player that emitted it
+        self.setup(*args, **kwargs)
+        
+        
     def register(self, brane: "Brane"):
-        """Add to the list of objects in the universe."""
-        super().register(brane)
+        """Add to the Brane's TractorStore."""
+        # if already registered with a brane, move wavelet to new one
+        if(self._store is not None):
+            self._store.remove(self)
+        brane.tractors.add(self)
+        self.parentBrane = brane
         
         if self.debug:
             self.parentBrane.parentUniverse.drawables.add(self)
             
         
     def update(self, dt: float):
-        super().update(dt)
+        """
+        Advance only this wavelet.
+        Registered Tractors are usually advanced all at once
+        by TractorStore.update() instead.
+        """
+        self.lifetime += dt
+        
+        # remove wavelet from store after its lifetime is over
+        if(self.lifetime > self.maxLifetime and self._store is not None):
+            self._store.remove(self)
         
         # remove wavelet from drawables after its lifetime is over
         if self.debug:
@@ -80,7 +132,48 @@ class Tractor(Wavelet, pygame.sprite.Sprite):
                 )
         
         # draw to screen
-        view.displaysurface.blit(self.img, rect)
+        view.queueBlit(self.img, rect, view.LAYER_DEBUG)
+        
+        
+    def boundingBox(self) -> npt.ArrayLike:
+        """
+        World space bounding box of the region where this wavelet is non-zero:
+        the part of the ring inside Rmax and the cone around dir.
+        Returned as [xmin, ymin, xmax, ymax] around the unwrapped source;
+        with PBC its periodic images are shifted by curUniverseSize.
+        Returns None if the region is empty.
+        """
+        front = self.v*self.lifetime
+        rin = max(front - 0.5*self.L, 0.)
+        rout = min(front + 0.5*self.L, self.Rmax)
+        if(rin >= rout):
+            return(None)
+        box = annularSectorBoxes(self.R[np.newaxis,:], self.dir[np.newaxis,:],
+                                 np.array([rin]), np.array([rout]),
+                                 np.array([self.theta0]))
+        return(box[0])
+        
+        
+    def evalDisplacements(self, dx: npt.ArrayLike, dy: npt.ArrayLike,
+                          want_f: bool = True,
+                          want_grad: bool = False) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Intencity and/or gradient at displacements (dx, dy) from the source,
+        broadcast against each other. Parameters go in as scalars.
+        """
+        shape = np.broadcast_shapes(np.shape(dx), np.shape(dy))
+        act, f, g = tractorKernel(dx, dy, self.dir, self.v*self.lifetime,
+                                  self.L, self.A, self.Rmax, self.theta0,
+                                  want_f, want_grad)
+        I = None
+        if(want_f):
+            I = np.zeros(shape)
+            I.reshape(-1)[act] = f
+        G = None
+        if(want_grad):
+            G = np.zeros(shape+(2,))
+            G.reshape(-1,2)[act] = g
+        return(I, G)
         
         
     def f(self, x: npt.ArrayLike) -> npt.ArrayLike:
@@ -88,102 +181,13 @@ class Tractor(Wavelet, pygame.sprite.Sprite):
         Wavelet intencity at points x.
         x : array of 2D points in shape (n,2).
         """
-        rprime = x - self.R[np.newaxis,:]        
-        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
-            # if pbc, distance should be to nearest periodic image           
-            ab = np.abs(rprime)
-            # both conditions ccan't be true at once
-            rprime[ab > np.abs(rprime + GlobalRules.curUniverseSize)] += GlobalRules.curUniverseSize
-            rprime[ab > np.abs(x - self.R[np.newaxis,:] - GlobalRules.curUniverseSize)] -= GlobalRules.curUniverseSize
-            
-        rprimeLen = np.linalg.norm(rprime, axis=-1)
-        
-        # Wavelet window, triangular: ___/\___
-        W = 1.0 - 2.0*np.abs(rprimeLen - self.v*self.lifetime)/self.L
-        mask = W>0.
-        W = W[mask]
-        
-        I = np.zeros((x.shape[0]))
-        if(np.any(mask)):  # only do this if there is an active point
-        
-            # distance dependence from source
-            Id = self.A*(np.sqrt(self.Rmax) - np.sqrt(rprimeLen[mask]))
-            Id = np.where(rprimeLen[mask] < self.Rmax, Id,
-                          np.zeros(Id.shape)  # 0 if beyond cutoff
-                          )
-            # angle dependence
-            cosTheta = np.dot(rprime[mask], self.dir)/rprimeLen[mask]
-            Ia = cosTheta - np.cos(self.theta0) # liniar in cos(theta)
-            Ia = np.where(Ia>0, Ia, 0.0)
-            
-            # putting it together:
-            I[mask] = W * Id * Ia
-        
-        return(I)
+        return(self.eval(x, True, False)[0])
     
     def gradf(self, x: npt.ArrayLike) -> npt.ArrayLike:
         """
         Gradient of wavelet intencity at point x.
         """
-        rprime = x - self.R[np.newaxis,:]        
-        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
-            # if pbc, distance should be to nearest periodic image           
-            ab = np.abs(rprime)
-            # both conditions ccan't be true at once
-            rprime[ab > np.abs(rprime + GlobalRules.curUniverseSize)] += GlobalRules.curUniverseSize
-            rprime[ab > np.abs(x - self.R[np.newaxis,:] - GlobalRules.curUniverseSize)] -= GlobalRules.curUniverseSize
-            
-        rprimeLen = np.linalg.norm(rprime, axis=-1)
-                
-        # Wavelet window, triangular: ___/\___
-        W = 1.0 - 2.0*np.abs(rprimeLen - self.v*self.lifetime)/self.L
-        mask = W>0.
-        W = W[mask]
-        
-        G = np.zeros(x.shape)
-        if(np.any(mask)):  # only do this if there is an active point
-            
-            # distance dependence from source
-            Id = self.A*(np.sqrt(self.Rmax) - np.sqrt(rprimeLen[mask]))
-            Id = np.where(rprimeLen[mask] < self.Rmax, Id,
-                          np.zeros(Id.shape)  # 0 if beyond cutoff
-                          )
-            # angle dependence
-            cosTheta = np.dot(rprime[mask], self.dir)/rprimeLen[mask]
-            Ia = cosTheta - np.cos(self.theta0) # liniar in cos(theta)
-            Ia = np.where(Ia>0, Ia, 0.0)
-            
-            
-            # gradients of components
-            gradrprime = rprime[mask]/rprimeLen[mask][:,np.newaxis]
-            
-            gradId = self.A*(np.sqrt(self.Rmax) + 0.5/np.sqrt(rprimeLen[mask]))
-            gradId = gradId[:,np.newaxis] * gradrprime
-            gradId = np.where(rprimeLen[mask][:,np.newaxis] < self.Rmax, gradId, 0.0)
-            
+        return(self.eval(x, False, True)[1])
 
-            gradIa = self.dir[np.newaxis,:] - (cosTheta[:,np.newaxis]*gradrprime)/(rprimeLen[mask]*rprimeLen[mask])[:,np.newaxis]
-            # apply the max for angular dependence too
-            gradIa = np.where(cosTheta[:,np.newaxis] > np.cos(self.theta0),
-                             gradIa, 0.0)
 
-            
-            relpos = rprimeLen[mask] - self.v*self.lifetime
-            gradW = np.where(np.logical_and(relpos>0, relpos<0.5*self.L),
-                             -2.0/self.L, 0.0) # 0 at peak of np.abs
-            gradW = np.where(np.logical_and(relpos<0, relpos>-0.5*self.L),
-                             +2.0/self.L, gradW)
-            gradW = gradW[:,np.newaxis] * gradrprime
-    
-            # chain rule the contributions
-            Ia = Ia[:,np.newaxis]
-            Id = Id[:,np.newaxis]
-            W = W[:,np.newaxis]
-
-            G[mask] = (gradId*Ia + Id*gradIa)*W + Id*Ia*gradW
-
-#        end_time = time.time()
-#        print("pre:", pre_time-start_time, "\tloop:", post_time-pre_time, "\tI:", end_time-post_time)
-        
-        return(G)
-    
\ No newline at end of file
+Tractor.pool = ObjectPool(Tractor)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import numpy.typing as npt
+import BraneSpace.core.GlobalRules as GlobalRules
+from BraneSpace.utils.Geometry import annularSectorBoxes, periodicAxisRanges
+from BraneSpace.utils.ObjectPool import releaseToPool
+
+
+# Maximum number of (wavelet, point) pairs evaluated at once.
+# Bounds the size of the temporary arrays in the kernels.
+PAIR_CHUNK = 1<<18
+
+
+def tractorKernel(dx: npt.ArrayLike, dy: npt.ArrayLike,
+                  direction: npt.ArrayLike,
+                  front: npt.ArrayLike, L: npt.ArrayLike, A: npt.ArrayLike,
+                  Rmax: npt.ArrayLike, theta0: npt.ArrayLike,
+                  want_f: bool, want_grad: bool):
+    """
+    Fused Tractor intensity and gradient for (point, wavelet) pairs.
+    Distances, window, cutoff and cone are computed once and shared by both.
+    dx, dy : components of the displacements from wavelet sources to points.
+        Broadcast against each other, e.g. shapes (K,) and (K,) for a list
+        of pairs, or (nx,1) and (1,ny) for a grid around one wavelet.
+    direction : unit wavelet directions, shape (...,2) broadcasting with dx.
+    front, L, A, Rmax, theta0 : wavelet parameters, scalars or arrays
+        broadcasting with dx. front is the ring radius, v*lifetime.
+    Returns flat indices of the active pairs in the broadcast shape and
+    their intensities and gradients (None if not requested).
+    """
+    if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+        # distance should be to nearest periodic image
+        uniSize = GlobalRules.curUniverseSize
+        dx = dx - uniSize*np.round(dx/uniSize)
+        dy = dy - uniSize*np.round(dy/uniSize)
+    rlen = np.sqrt(dx*dx + dy*dy)
+
+    # Wavelet window, triangular: ___/\___
+    W = 1.0 - 2.0*np.abs(rlen - front)/L
+
+    # only points inside the window, cutoff and cone contribute
+    cosTheta0 = np.cos(theta0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cosTheta = (dx*direction[...,0] + dy*direction[...,1])/rlen
+    active = (W > 0.) & (rlen < Rmax) & (cosTheta > cosTheta0)
+    act = np.flatnonzero(active)
+    shape = active.shape
+    at = np.unravel_index(act, shape)
+    rlen = rlen[at]
+    W = W[at]
+    cosTheta = cosTheta[at]
+    A = atActive(A, shape, at)
+    sqrtRmax = np.sqrt(atActive(Rmax, shape, at))
+
+    # distance and angle dependence
+    Id = A*(sqrtRmax - np.sqrt(rlen))
+    Ia = cosTheta - atActive(cosTheta0, shape, at) # liniar in cos(theta)
+
+    f = None
+    if(want_f):
+        f = W * Id * Ia
+
+    G = None
+    if(want_grad):
+        # gradients of components
+        gradrprime = np.stack((atActive(dx, shape, at),
+                               atActive(dy, shape, at)), axis=-1)
+        gradrprime /= rlen[:,np.newaxis]
+        gradId = (A*(sqrtRmax + 0.5/np.sqrt(rlen)))[:,np.newaxis] * gradrprime
+        direction = np.stack((atActive(direction[...,0], shape, at),
+                              atActive(direction[...,1], shape, at)), axis=-1)
+        gradIa = direction - (cosTheta[:,np.newaxis]*gradrprime)/(rlen*rlen)[:,np.newaxis]
+
+        relpos = rlen - atActive(front, shape, at)
+        L = atActive(L, shape, at)
+        gradW = np.where(np.logical_and(relpos>0, relpos<0.5*L),
+                         -2.0/L, 0.0) # 0 at peak of np.abs
+        gradW = np.where(np.logical_and(relpos<0, relpos>-0.5*L),
+                         +2.0/L, gradW)
+        gradW = gradW[:,np.newaxis] * gradrprime
+
+        # chain rule the contributions
+        Ia = Ia[:,np.newaxis]
+        Id = Id[:,np.newaxis]
+        W = W[:,np.newaxis]
+        G = (gradId*Ia + Id*gradIa)*W + Id*Ia*gradW
+
+    return(act, f, G)
+
+
+def atActive(p: npt.ArrayLike, shape: tuple, at: tuple) -> npt.ArrayLike:
+    """
+    Values of a kernel input at the active pairs: scalars stay scalars,
+    arrays are broadcast to the pair shape without copying first.
+    """
+    if(np.ndim(p) == 0):
+        return(p)
+    return(np.broadcast_to(p, shape)[at])
+
+
+class TractorStore:
+    """
+    Packed storage for all Tractor wavelets on a Brane.
+    Wavelet parameters are kept as columns of NumPy arrays, so intensities
+    and gradients of all live wavelets can be summed in one vectorized pass.
+    Registered Tractors are thin views onto their slot in this store.
+    """
+    # per-wavelet columns and their trailing shapes
+    columns = {"R": (2,), "dir": (2,), "v": (), "L": (), "A": (),
+               "Rmax": (), "theta0": (), "lifetime": (), "maxLifetime": ()}
+
+    def __init__(self, capacity: int = 64):
+        self.n = 0          # number of live wavelets
+        self.owners = []    # wavelet objects, indexed by slot
+        self.version = 0    # bumped whenever stored wavelets change,
+                            # including writes through their StoreFields
+        self.capacity = 0
+        self.reserve(capacity)
+
+    def __len__(self):
+        return(self.n)
+
+    def reserve(self, capacity: int):
+        """
+        Grow the columns so they can hold at least capacity wavelets.
+        """
+        if(capacity <= self.capacity):
+            return
+        for name, shape in self.columns.items():
+            new = np.zeros((capacity,)+shape)
+            if(self.capacity > 0):
+                new[:self.n] = getattr(self, name)[:self.n]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def add(self, wl: "Tractor"):
+        """
+        Copy a wavelet's parameters into a new slot and
+        make the wavelet a view onto it.
+        """
+        if(self.n == self.capacity):
+            self.reserve(2*self.capacity)
+        slot = self.n
+        for name in self.columns:
+            getattr(self, name)[slot] = getattr(wl, name)
+
+        # switch wavelet's fields over to the store
+        wl._store = self
+        wl._slot = slot
+        self.owners.append(wl)
+        self.n += 1
+        self.version += 1
+
+    def remove(self, wl: "Tractor"):
+        """
+        Remove a single wavelet from the store.
+        """
+        keep = np.ones(self.n, dtype=bool)
+        keep[wl._slot] = False
+        self.compact(keep)
+
+    def detach(self, wl: "Tractor"):
+        """
+        Copy slot values back into the wavelet, so it stays usable
+        after it leaves the store.
+        """
+        for name in self.columns:
+            value = getattr(self, name)[wl._slot]
+            wl.__dict__[name] = value.copy() if np.ndim(value) else value.item()
+        wl._store = None
+        wl._slot = None
+
+    def compact(self, keep: npt.ArrayLike):
+        """
+        Drop the wavelets not flagged in keep and pack the survivors
+        to the front of the columns.
+        """
+        for wl in [o for o,k in zip(self.owners, keep) if not k]:
+            self.detach(wl)
+            wl.parentBrane = None
+
+        m = np.count_nonzero(keep)
+        for name in self.columns:
+            col = getattr(self, name)
+            col[:m] = col[:self.n][keep]
+        self.owners = [o for o,k in zip(self.owners, keep) if k]
+        for slot, wl in enumerate(self.owners):
+            wl._slot = slot
+        self.n = m
+        self.version += 1
+
+    def snapshot(self) -> dict:
+        """
+        Copy of the live rows of every column, for sending to another process.
+        """
+        return({name: getattr(self, name)[:self.n].copy()
+                for name in self.columns})
+
+    def loadSnapshot(self, snap: dict):
+        """
+        Replace the stored parameters with a snapshot().
+        The store has no owners afterwards, so it can only be evaluated.
+        """
+        n = snap["R"].shape[0]
+        self.reserve(n)
+        for name in self.columns:
+            getattr(self, name)[:n] = snap[name]
+        self.owners = []
+        self.n = n
+        self.version += 1
+
+    def clear(self):
+        """
+        Remove all wavelets.
+        """
+        self.compact(np.zeros(self.n, dtype=bool))
+
+    def update(self, dt: float):
+        """
+        Advance lifetimes of all wavelets and retire expired ones.
+        """
+        lifetime = self.lifetime[:self.n]
+        lifetime += dt
+        self.version += 1
+        expired = lifetime > self.maxLifetime[:self.n]
+        if(np.any(expired)):
+            retired = [self.owners[k] for k in np.flatnonzero(expired)]
+            self.compact(np.logical_not(expired))
+            for wl in retired:
+                releaseToPool(wl)
+
+    def boundingBoxes(self) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        World space bounding boxes of the regions where wavelets are non-zero,
+        as rows of [xmin, ymin, xmax, ymax] around the unwrapped sources.
+        Returns the boxes and a mask of which regions are non-empty.
+        """
+        n = self.n
+        front = self.v[:n]*self.lifetime[:n]
+        rin = np.maximum(front - 0.5*self.L[:n], 0.)
+        rout = np.minimum(front + 0.5*self.L[:n], self.Rmax[:n])
+        boxes = annularSectorBoxes(self.R[:n], self.dir[:n],
+                                   rin, rout, self.theta0[:n])
+        return(boxes, rin < rout)
+        
+    def _pairs(self, d: npt.ArrayLike, w: npt.ArrayLike,
+               want_f: bool, want_grad: bool):
+        """
+        Evaluate tractorKernel for (point, wavelet) pairs.
+        d : displacements from wavelet sources to points, shape (K,2).
+        w : wavelet slot of each pair, shape (K,).
+        """
+        return(tractorKernel(d[:,0], d[:,1], self.dir[w],
+                             self.v[w]*self.lifetime[w],
+                             self.L[w], self.A[w], self.Rmax[w],
+                             self.theta0[w], want_f, want_grad))
+
+    def eval(self, x: npt.ArrayLike, want_f: bool = True,
+             want_grad: bool = False) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Summed intensity and/or gradient of all wavelets at points x.
+        x : array of 2D points in shape (n,2).
+        Returns (I, G); fields that were not requested are None.
+        """
+        P = x.shape[0]
+        I = np.zeros(P) if want_f else None
+        G = np.zeros((P,2)) if want_grad else None
+        if(self.n == 0 or P == 0):
+            return(I, G)
+
+        # chunk over wavelets to bound temporary array sizes
+        step = max(1, PAIR_CHUNK//P)
+        for s in range(0, self.n, step):
+            e = min(s+step, self.n)
+            d = (x[np.newaxis,:,:] - self.R[s:e,np.newaxis,:]).reshape(-1,2)
+            w = np.repeat(np.arange(s, e), P)
+            act, f, g = self._pairs(d, w, want_f, want_grad)
+            p = act % P  # point index of each active pair
+            if(want_f):
+                I += np.bincount(p, weights=f, minlength=P)
+            if(want_grad):
+                G[:,0] += np.bincount(p, weights=g[:,0], minlength=P)
+                G[:,1] += np.bincount(p, weights=g[:,1], minlength=P)
+        return(I, G)
+
+    def f(self, x: npt.ArrayLike) -> npt.ArrayLike:
+        """
+        Summed intensity of all wavelets at points x of shape (n,2).
+        """
+        return(self.eval(x, True, False)[0])
+
+    def gradf(self, x: npt.ArrayLike) -> npt.ArrayLike:
+        """
+        Summed gradient of intensity of all wavelets at points x of shape (n,2).
+        """
+        return(self.eval(x, False, True)[1])
+
+    def evalGrid(self, xs: npt.ArrayLike, ys: npt.ArrayLike,
+                 origin: npt.ArrayLike, spacing: float, want_f: bool = True,
+                 want_grad: bool = False) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Summed intensity and/or gradient on a regular grid.
+        Each wavelet is only evaluated inside its bounding box
+        and the periodic images of that box.
+        xs, ys : world coordinates of the grid axes in shapes (nx,) and (ny,),
+                 equal to origin + i*spacing up to periodic wrapping.
+                 Grid point (i,j) is at (xs[i], ys[j]).
+        Returns (I, G) in shapes (nx,ny) and (nx,ny,2);
+        fields that were not requested are None.
+        """
+        nx = xs.size
+        ny = ys.size
+        P = nx*ny
+        I = np.zeros(P) if want_f else None
+        G = np.zeros((P,2)) if want_grad else None
+        
+        boxes, nonempty = self.boundingBoxes()
+        w = np.flatnonzero(nonempty)
+        if(w.size == 0):
+            return(I if I is None else I.reshape(nx,ny),
+                   G if G is None else G.reshape(nx,ny,2))
+        boxes = boxes[w]
+        
+        # grid index ranges covered by each box along each axis
+        uniSize = None
+        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+            uniSize = GlobalRules.curUniverseSize
+        x0, x1, xvalid = periodicAxisRanges(boxes[:,0], boxes[:,2], origin[0],
+                                            spacing, nx, uniSize)
+        y0, y1, yvalid = periodicAxisRanges(boxes[:,1], boxes[:,3], origin[1],
+                                            spacing, ny, uniSize)
+        
+        # rectangles: every x range of a wavelet with every y range of it
+        wi, a, b = np.nonzero(xvalid[:,:,np.newaxis] & yvalid[:,np.newaxis,:])
+        rect_w = w[wi]
+        rect_x0 = x0[wi,a]
+        rect_y0 = y0[wi,b]
+        rect_ny = y1[wi,b] - rect_y0 + 1
+        rect_cnt = (x1[wi,a] - rect_x0 + 1)*rect_ny
+        ends = np.cumsum(rect_cnt)
+        
+        # chunk over rectangles to bound temporary array sizes
+        s = 0
+        while(s < rect_cnt.size):
+            e = np.searchsorted(ends, ends[s] - rect_cnt[s] + PAIR_CHUNK,
+                                side='right')
+            e = max(e, s+1)
+            cnt = rect_cnt[s:e]
+            
+            # grid cell of every (rectangle, cell) pair
+            t = np.arange(np.sum(cnt)) - np.repeat(np.cumsum(cnt)-cnt, cnt)
+            rny = np.repeat(rect_ny[s:e], cnt)
+            ix = np.repeat(rect_x0[s:e], cnt) + t//rny
+            iy = np.repeat(rect_y0[s:e], cnt) + t%rny
+            wk = np.repeat(rect_w[s:e], cnt)
+            
+            d = np.empty((t.size,2))
+            d[:,0] = xs[ix] - self.R[wk,0]
+            d[:,1] = ys[iy] - self.R[wk,1]
+            act, f, g = self._pairs(d, wk, want_f, want_grad)
+            p = ix[act]*ny + iy[act]
+            if(want_f):
+                I += np.bincount(p, weights=f, minlength=P)
+            if(want_grad):
+                G[:,0] += np.bincount(p, weights=g[:,0], minlength=P)
+                G[:,1] += np.bincount(p, weights=g[:,1], minlength=P)
+            s = e
+            
+        return(I if I is None else I.reshape(nx,ny),
+               G if G is None else G.reshape(nx,ny,2))
@@ -30,6 +30,12 @@ class Wavelet:
         self.lifetime = 0
         self.parentBrane = None
         
+    def __getstate__(self):
+        # pickled without the brane, for the simulation process
+        state = self.__dict__.copy()
+        state["parentBrane"] = None
+        return(state)
+        
     def register(self, parentBrane: "Brane"):
         # if already registered with a brane, move wavelet to new one
         if(self.parentBrane):
@@ -45,52 +51,90 @@ class Wavelet:
             self.parentBrane.wavelets.remove(self)
             self.parentBrane = None
         
-    def f(self, x: npt.ArrayLike) -> npt.ArrayLike:
+    def boundingBox(self) -> npt.ArrayLike:
+        """
+        World space bounding box of the region where this wavelet is non-zero,
+        as [xmin, ymin, xmax, ymax] around the unwrapped source.
+        With PBC its periodic images are shifted by curUniverseSize.
+        Returns None if the region is empty.
+        """
+        front = self.v*self.lifetime
+        if(front <= 0):
+            return(None)
+        return(np.concatenate((self.R - front, self.R + front)))
+        
+    def eval(self, x: npt.ArrayLike, want_f: bool = True,
+             want_grad: bool = False) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Wavelet intencity and/or its gradient at points x in one pass.
+        x : array of 2D points in shape (...,2).
+        Returns (I, G); fields that were not requested are None.
         """
-        Wavelet intencity at points x.
-        """        
         rprime = x - self.R       
         if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
             # if pbc, distance should be to nearest periodic image           
-            ab = np.abs(rprime)
-            # both conditions ccan't be true at once
-            rprime[ab > np.abs(rprime + GlobalRules.curUniverseSize)] += GlobalRules.curUniverseSize
-            rprime[ab > np.abs(x - self.R - GlobalRules.curUniverseSize)] -= GlobalRules.curUniverseSize
-            
-        distMat = np.sqrt(np.sum(rprime*rprime, axis=-1))
+            uniSize = GlobalRules.curUniverseSize
+            rprime -= uniSize*np.round(rprime/uniSize)
+        return(self.evalDisplacements(rprime[...,0], rprime[...,1],
+                                      want_f, want_grad))
         
+    def evalGrid(self, xs: npt.ArrayLike, ys: npt.ArrayLike,
+                 want_f: bool = True,
+                 want_grad: bool = False) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Like eval() on the grid of points (xs[i], ys[j]).
+        Nearest periodic images are found per axis, and the axes are
+        only broadcast against each other inside the field maths.
+        """
+        dx = xs - self.R[0]
+        dy = ys - self.R[1]
+        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
+            uniSize = GlobalRules.curUniverseSize
+            dx -= uniSize*np.round(dx/uniSize)
+            dy -= uniSize*np.round(dy/uniSize)
+        return(self.evalDisplacements(dx[:,np.newaxis], dy[np.newaxis,:],
+                                      want_f, want_grad))
+        
+    def evalDisplacements(self, dx: npt.ArrayLike, dy: npt.ArrayLike,
+                          want_f: bool = True,
+                          want_grad: bool = False) -> (npt.ArrayLike, npt.ArrayLike):
+        """
+        Intencity and/or gradient at displacements (dx, dy) from the source.
+        dx and dy are broadcast against each other, the fields
+        have their broadcast shape (plus a trailing 2 for the gradient).
+        """
+        distMat = np.sqrt(dx*dx + dy*dy)
         mask = np.logical_and(
                 distMat <= self.v*self.lifetime,
                 distMat >= max(0, self.v*self.lifetime - self.L)
                 )
-        I = np.zeros((x.shape[0], x.shape[1]))
-        I[mask] = self.A*np.sin(self.k*distMat[mask] - self.w*self.lifetime)
-        I[mask] /= self.v*self.lifetime # Conserve intensity with time
-        return(I)
+        phase = self.k*distMat[mask] - self.w*self.lifetime
+        
+        I = None
+        if(want_f):
+            I = np.zeros(distMat.shape)
+            I[mask] = self.A*np.sin(phase)
+            I[mask] /= self.v*self.lifetime # Conserve intensity with time
+            
+        G = None
+        if(want_grad):
+            G = np.zeros(distMat.shape+(2,))
+            if(np.any(mask)):  # only do this if there is an active point
+                g = self.A*np.cos(phase) * self.k/(2*distMat[mask])
+                g /= self.v*self.lifetime # Conserve intensity with time
+                G[mask,0] = g*np.broadcast_to(dx, distMat.shape)[mask]
+                G[mask,1] = g*np.broadcast_to(dy, distMat.shape)[mask]
         
+        return(I, G)
+        
+    def f(self, x: npt.ArrayLike) -> npt.ArrayLike:
+        """
+        Wavelet intencity at points x.
+        """
+        return(self.eval(x, True, False)[0])
         
     def gradf(self, x: npt.ArrayLike) -> npt.ArrayLike:
         """
         Gradient of wavelet intencity at point x.
         """
-        rprime = x - self.R       
-        if(GlobalRules.pbc == GlobalRules.PBC.TOROIDAL):
-            # if pbc, distance should be to nearest periodic image           
-            ab = np.abs(rprime)
-            # both conditions ccan't be true at once
-            rprime[ab > np.abs(rprime + GlobalRules.curUniverseSize)] += GlobalRules.curUniverseSize
-            rprime[ab > np.abs(x - self.R - GlobalRules.curUniverseSize)] -= GlobalRules.curUniverseSize
-            
-        distMat = np.sqrt(np.sum(rprime*rprime, axis=-1))
-        mask = np.logical_and(
-                distMat <= self.v*self.lifetime,
-                distMat >= max(0, self.v*self.lifetime - self.L)
-                )
-
-        G = np.zeros(x.shape)
-        if(np.any(mask)):  # only do this if there is an active point
-            G[mask] = (self.A*np.cos(self.k*distMat[mask] - self.w*self.lifetime))[:,np.newaxis]
-            G[mask]*= rprime[mask,:] * self.k/(2*distMat[mask])[:,np.newaxis]
-            G[mask]/= self.v*self.lifetime # Conserve intensity with time
-        
-        return(G)
+        return(self.eval(x, False, True)[1])